@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Columnar (Parquet / Feather) storage of documents.
+
+Documents are stored one row per paragraph, in document order, with the
+columns:
+    - doc_id (int64): The document's number, as used for `doc_id` in the
+      database (file order for texts.txt)
+    - title (string): The document title
+    - node_id (int64, null): The document's database node id
+    - pid (int32, null): The paragraph's number in its document (null in the
+      single row of a document without paragraphs)
+    - paragraph_id (int64, null): The paragraph's database node id
+    - text (string, null): The paragraph text
+    - bowv (list<float64>, null): The document's bag of words vector
+
+Files ending in `.parquet` are written as Parquet and anything else as
+Feather (the Arrow IPC file format), which is memory-mapped when read. Both
+are read back in record batches, so a corpus never has to fit in memory.
+
+"""
+import logging
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data.structures import Document
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = pa.schema([
+    ('doc_id', pa.int64()),
+    ('title', pa.string()),
+    ('node_id', pa.int64()),
+    ('pid', pa.int32()),
+    ('paragraph_id', pa.int64()),
+    ('text', pa.string()),
+    ('bowv', pa.list_(pa.float64())),
+])
+
+
+def _is_parquet(path):
+    return path.endswith('.parquet')
+
+
+class _BatchBuilder(object):
+    """Collects paragraph rows into record batches."""
+    def __init__(self):
+        self.columns = {name: [] for name in SCHEMA.names}
+
+    def __len__(self):
+        return len(self.columns['doc_id'])
+
+    def add(self, doc_id, doc):
+        bowv = None if doc.bowv is None else list(doc.bowv)
+        paras = [(pid, p.id, p.text) for pid, p in enumerate(doc.paragraphs())]
+        for pid, para_id, text in paras or [(None, None, None)]:
+            for name, value in (('doc_id', doc_id), ('title', doc.title),
+                                ('node_id', doc.id), ('pid', pid),
+                                ('paragraph_id', para_id), ('text', text),
+                                ('bowv', bowv)):
+                self.columns[name].append(value)
+
+    def flush(self):
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(self.columns[name], type=SCHEMA.field(name).type)
+             for name in SCHEMA.names],
+            schema=SCHEMA
+        )
+        self.columns = {name: [] for name in SCHEMA.names}
+        return batch
+
+
+def export_columnar(docs, path, batch_size=65536, doc_ids=None):
+    """Writes documents to a Parquet or Feather file.
+
+    Args:
+        docs: Iterable of Documents.
+        path (str): File to write, Parquet if it ends in `.parquet`.
+        batch_size (int): Number of paragraph rows per record batch (and
+            Parquet row group).
+        doc_ids: Iterable of the documents' doc_ids, their position in
+            `docs` by default.
+
+    Returns:
+        int: The number of documents written.
+    """
+    if _is_parquet(path):
+        writer = pq.ParquetWriter(path, SCHEMA)
+    else:
+        writer = pa.ipc.new_file(path, SCHEMA)
+    builder = _BatchBuilder()
+    doc_ids = iter(doc_ids) if doc_ids is not None else None
+    num_docs = 0
+    try:
+        for n, doc in enumerate(docs):
+            builder.add(n if doc_ids is None else next(doc_ids), doc)
+            num_docs += 1
+            if len(builder) >= batch_size:
+                writer.write_table(pa.Table.from_batches([builder.flush()]))
+            if num_docs % 10000 == 0:
+                logger.debug('Exported %d documents' % num_docs)
+        if len(builder):
+            writer.write_table(pa.Table.from_batches([builder.flush()]))
+    finally:
+        writer.close()
+    logger.info("Exported %d documents to %s.", num_docs, path)
+    return num_docs
+
+
+def iter_batches(path, columns=None, batch_size=65536):
+    """Yields the record batches of a file written by `export_columnar`.
+
+    Args:
+        path (str): The Parquet or Feather file.
+        columns (list[str]): Columns to read, all of them by default.
+        batch_size (int): Number of rows per batch (Parquet only, Feather
+            batches are read as written).
+    """
+    if _is_parquet(path):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size,
+                                                       columns=columns):
+            yield batch
+        return
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for n in range(reader.num_record_batches):
+            batch = reader.get_batch(n)
+            if columns is not None:
+                batch = pa.RecordBatch.from_arrays(
+                    [batch.column(batch.schema.get_field_index(c))
+                     for c in columns],
+                    names=columns
+                )
+            yield batch
+
+
+def read_columnar(path, batch_size=65536):
+    """Yields the Documents of a file written by `export_columnar`.
+
+    Rows are streamed batch by batch and grouped back into documents, which
+    may span batches.
+    """
+    rows = []
+    for batch in iter_batches(path, batch_size=batch_size):
+        columns = batch.to_pydict()
+        for row in zip(*(columns[name] for name in SCHEMA.names)):
+            if rows and row[0] != rows[0][0]:
+                yield _document(rows)
+                rows = []
+            rows.append(row)
+    if rows:
+        yield _document(rows)
+
+
+def _document(rows):
+    _, title, node_id, _, _, _, bowv = rows[0]
+    rows = [row for row in rows if row[3] is not None]
+    paragraph_ids = [row[4] for row in rows]
+    return Document.from_paragraphs(
+        [row[5] for row in rows], title, node_id=node_id,
+        paragraph_ids=None if None in paragraph_ids else paragraph_ids,
+        bowv=bowv
+    )
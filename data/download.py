@@ -1,8 +1,17 @@
 import gzip
 import bz2
+import heapq
+import html
+import io
+import os
 import re
-from urllib.request import urlopen
-from utils import maybe_download
+import shutil
+import tempfile
+from zlib import crc32
+from itertools import chain
+from multiprocessing import Pool, cpu_count
+from operator import itemgetter
+from utils import maybe_download, TMP_DIR, DOWNLOADER
 from .wikiextractor.WikiExtractor import Extractor
 import logging
 
@@ -10,142 +19,595 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def wiki_page_counts(min_count=50, num_hours=12):
+class PageCounter(object):
+    """Page view counter that spills sorted runs to disk when it grows.
+
+    Counts are held in a dict until it holds `max_keys` titles, at which point
+    they are written to a sorted run file in `spill_dir` and the dict is
+    cleared. `items` merges the in-memory counts with every run so memory use
+    is bounded by `max_keys` rather than by the number of distinct titles.
+
+    Args:
+        max_keys (int): Number of titles held in memory before spilling.
+        spill_dir (str): Directory the sorted runs are written to.
+    """
+    def __init__(self, max_keys=2000000, spill_dir=TMP_DIR):
+        self.max_keys = max_keys
+        self.spill_dir = spill_dir
+        self.counts = {}
+        self.runs = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, title, count):
+        counts = self.counts
+        counts[title] = counts.get(title, 0) + count
+        if len(counts) >= self.max_keys:
+            self.spill()
+
+    def update(self, counts):
+        for title, count in counts.items():
+            self.add(title, count)
+
+    def _new_run(self):
+        return tempfile.NamedTemporaryFile(
+            'wb', dir=self.spill_dir, prefix='pagecounts-', suffix='.run',
+            delete=False
+        )
+
+    def spill(self):
+        if not self.counts:
+            return
+        with self._new_run() as f:
+            for title in sorted(self.counts):
+                f.write(b'%s %d\n' % (title, self.counts[title]))
+        logger.debug('Spilled %d page counts to %s.',
+                     len(self.counts), f.name)
+        self.runs.append(f.name)
+        self.counts = {}
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, 'rb') as f:
+            for line in f:
+                title, count = line.rsplit(b' ', 1)
+                yield title, int(count)
+
+    def items(self):
+        """Yields (title, count) pairs in title order, merging spilled runs.
+
+        The spilled run files are removed once they have been read.
+        """
+        streams = [self._read_run(p) for p in self.runs]
+        streams.append((t, self.counts[t]) for t in sorted(self.counts))
+        title, total = None, 0
+        try:
+            for t, c in heapq.merge(*streams, key=itemgetter(0)):
+                if t == title:
+                    total += c
+                    continue
+                if title is not None:
+                    yield title, total
+                title, total = t, c
+            if title is not None:
+                yield title, total
+        finally:
+            for path in self.runs:
+                os.remove(path)
+            self.runs = []
+            self.counts = {}
+
+    def most_common(self, min_count=0, top_k=None):
+        """Returns (title, count) pairs sorted by count, highest first.
+
+        Only the pairs with at least `min_count` views (and only the `top_k`
+        highest of those, if given) are ever held in memory.
+        """
+        counts = (item for item in self.items() if item[1] >= min_count)
+        if top_k is not None:
+            return heapq.nlargest(top_k, counts, key=itemgetter(1))
+        counts = list(counts)
+        counts.sort(key=itemgetter(1), reverse=True)
+        return counts
+
+
+def count_page_views(f, counts, prefix=b'en '):
+    """Adds the views of every `prefix` page in a pageviews file to `counts`.
+
+    Args:
+        f: Binary file object of an uncompressed pageviews file.
+        counts: dict or PageCounter that the views are added to.
+        prefix (bytes): Project code (plus trailing space) to keep.
+    """
+    n = len(prefix)
+    if isinstance(counts, dict):
+        get = counts.get
+        for line in f:
+            if line[:n] != prefix:
+                continue
+            fields = line.split()
+            if len(fields) != 4:
+                continue
+            counts[fields[1]] = get(fields[1], 0) + int(fields[2])
+    else:
+        for line in f:
+            if line[:n] != prefix:
+                continue
+            fields = line.split()
+            if len(fields) != 4:
+                continue
+            counts.add(fields[1], int(fields[2]))
+    return counts
+
+
+def page_view_files(num_hours=12):
+    """Returns the urls of the latest `num_hours` hourly pageview files."""
     url = "https://dumps.wikimedia.org/other/pageviews/"
     logger.debug(f"Querying {url} for page_counts.")
-    with urlopen(url) as f:
-        years = [m[1] for m in re.finditer(
-                r'<a href="(\d+/)', f.read().decode('utf-8')
-        )]
+    years = [m[1] for m in re.finditer(
+            r'<a href="(\d+/)', DOWNLOADER.read(url).decode('utf-8')
+    )]
 
     url = url + years[-1]
     logger.debug(f"Querying {url} for page_counts.")
-    with urlopen(url) as f:
-        yr_mons = [m[1] for m in re.finditer(
-                r'<a href="(\d+-\d+/)', f.read().decode('utf-8')
-        )]
+    yr_mons = [m[1] for m in re.finditer(
+            r'<a href="(\d+-\d+/)', DOWNLOADER.read(url).decode('utf-8')
+    )]
 
     url = url + yr_mons[-1]
     logger.debug(f"Querying {url} for page_counts.")
-    with urlopen(url) as f:
-        files = [url+m[1] for m in re.finditer(
-                r'<a.*(pageviews-\d+-\d+.gz)', f.read().decode('utf-8')
-        )]
+    files = [url+m[1] for m in re.finditer(
+            r'<a.*(pageviews-\d+-\d+.gz)', DOWNLOADER.read(url).decode('utf-8')
+    )]
+    return files[-num_hours:]
+
 
-    en_counts = {}
+def _count_page_view_files(args):
+    """Pool worker: counts a batch of hourly pageview files.
+
+    The counts are written to one sorted run per partition of the titles
+    (by the crc32 of the title), so the partitions can be merged
+    concurrently.
+
+    Returns:
+        list[str]: The run of every partition.
+    """
+    urls, max_keys, partitions = args
+    counts = PageCounter(max_keys=max_keys)
+    for url in urls:
+        with gzip.GzipFile(fileobj=maybe_download(url)) as f:
+            count_page_views(f, counts)
+    runs = [counts._new_run() for _ in range(partitions)]
+    try:
+        for title, count in counts.items():
+            runs[crc32(title) % partitions].write(b'%s %d\n' % (title, count))
+    finally:
+        for run in runs:
+            run.close()
+    return [run.name for run in runs]
+
+
+def _merge_page_count_runs(args):
+    """Pool worker: merges the runs of one partition of the titles."""
+    runs, min_count, top_k = args
+    counts = PageCounter()
+    counts.runs = list(runs)
+    return counts.most_common(min_count=min_count, top_k=top_k)
+
+
+def _parallel_page_counts(files, processes, max_keys, min_count, top_k):
+    """`wiki_page_counts` of `files` in a pool of `processes` workers."""
+    batches = [(files[n::processes], max_keys, processes)
+               for n in range(processes) if files[n::processes]]
+    with Pool(processes) as pool:
+        partitions = zip(*pool.imap_unordered(_count_page_view_files,
+                                              batches))
+        merged = chain.from_iterable(pool.imap(
+            _merge_page_count_runs,
+            [(runs, min_count, top_k) for runs in partitions]
+        ))
+        if top_k is not None:
+            # Ties are broken by title, as in PageCounter.most_common.
+            return heapq.nsmallest(top_k, merged,
+                                   key=lambda item: (-item[1], item[0]))
+        merged = list(merged)
+    # Each partition is sorted already, so this only merges them.
+    merged.sort(key=itemgetter(1), reverse=True)
+    return merged
+
+
+def wiki_page_counts(min_count=50, num_hours=12, top_k=None,
+                     max_keys=2000000, processes=1):
+    """Returns the English wiki pages viewed most over the last few hours.
+
+    Args:
+        min_count (int): Minimum number of views for a page to be returned.
+        num_hours (int): Number of hourly pageview files to aggregate.
+        top_k (int): If given, only the `top_k` most viewed pages are returned.
+        max_keys (int): Number of titles counted in memory before the counts
+            are spilled to disk.
+        processes (int): Number of worker processes that parse the hourly
+            files concurrently. Each worker counts its share of the hours
+            into its own spilling counter (holding up to `max_keys` titles)
+            and writes it out as one sorted run per partition of the titles.
+            The pool then merges the partitions concurrently, so only the
+            pages kept are combined here. `None` uses one process per core,
+            1 parses every file in this process. The files themselves are
+            always downloaded concurrently by `utils.DOWNLOADER` first.
+
+    Returns:
+        list[tuple[bytes, int]]: (title, views) pairs, most viewed first.
+            Without `top_k`, pages with the same views may be in a different
+            order with a pool than without.
+    """
+    files = page_view_files(num_hours)
     logger.info(f'Downloading {num_hours} hours of pageview counts.')
-    for page_view_file in files[-num_hours:]:
-        with gzip.GzipFile(fileobj=maybe_download(page_view_file)) as f:
-            for line in f:
-                if line[:3] == b'en ':
-                    if len(line.split()) != 4:
-                        continue
-                    if line.split()[-3] not in en_counts:
-                        en_counts[line.split()[-3]] = int(line.split()[-2])
-                    else:
-                        en_counts[line.split()[-3]] += int(line.split()[-2])
-
-    en_counts = [
-        (w, count) for w, count in en_counts.items() if count >= min_count
-    ]
-    en_counts.sort(key=lambda x: x[1], reverse=True)
+    DOWNLOADER.fetch_all(files)
+    if processes == 1:
+        en_counts = PageCounter(max_keys=max_keys)
+        for page_view_file in files:
+            with gzip.GzipFile(fileobj=maybe_download(page_view_file)) as f:
+                count_page_views(f, en_counts)
+        en_counts = en_counts.most_common(min_count=min_count, top_k=top_k)
+    else:
+        en_counts = _parallel_page_counts(files, processes or cpu_count(),
+                                          max_keys, min_count, top_k)
+
     logger.info('%d wiki pages found with at least %d views.',
                 len(en_counts), min_count)
     return en_counts
 
 
-def wiki_xml_dump(txt_file_path: str, min_count=50, num_hours=12):
+def popular_titles(min_count=50, num_hours=12, path=None):
+    """Returns the set of wiki page titles with at least `min_count` views.
+
+    Titles are converted to the form used in the xml dump (spaces rather than
+    underscores).
+
+    Args:
+        min_count (int): Minimum number of views over `num_hours`.
+        num_hours (int): Number of hourly pageview files to aggregate.
+        path (str): Optional file the titles are persisted to, one per line.
+            If it already exists the titles are read from it instead of being
+            recounted.
+
+    Returns:
+        set[str]: The popular titles.
+    """
+    if path is not None and os.path.exists(path):
+        logger.debug("Using cached popular titles at %s", path)
+        with open(path, 'r', encoding='utf-8') as f:
+            return set(line.rstrip('\n') for line in f)
+
+    popular = set(
+        v[0].decode('utf-8').replace('_', ' ')
+        for v in wiki_page_counts(min_count=min_count, num_hours=num_hours)
+    )
+    if path is not None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for title in sorted(popular):
+                f.write(title + '\n')
+    return popular
+
+
+def multistream_blocks(index_file, titles=None):
+    """Maps each bz2 stream in the multistream dump to its wanted titles.
+
+    Args:
+        index_file: Binary file object of the uncompressed multistream index,
+            whose lines have the form `offset:page_id:title`.
+        titles (set[str]): The wanted page titles. If None, every stream is
+            returned and mapped to None (every page in it is wanted).
+
+    Returns:
+        dict[int, set[str]]: Byte offset into the dump -> wanted titles,
+            in dump order.
+    """
+    blocks = {}
+    if titles is None:
+        for line in index_file:
+            blocks.setdefault(int(line[:line.index(b':')]), None)
+        return dict(sorted(blocks.items()))
+
+    wanted = set(t.encode('utf-8') for t in titles)
+    for line in index_file:
+        offset, _, title = line.rstrip(b'\n').split(b':', 2)
+        if title in wanted:
+            blocks.setdefault(int(offset), set()).add(title.decode('utf-8'))
+    return dict(sorted(blocks.items()))
+
+
+def read_stream(f, offset, chunk_size=1024*256):
+    """Decompresses the single bz2 stream starting at `offset` in `f`."""
+    f.seek(offset)
+    decompressor = bz2.BZ2Decompressor()
+    data = []
+    while not decompressor.eof:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        data.append(decompressor.decompress(chunk))
+    return b''.join(data)
+
+
+def multistream_pages(f, offsets):
+    """Yields the pages of the multistream blocks starting at `offsets`."""
+    for n, offset in enumerate(offsets):
+        if n % 100 == 0:
+            logger.debug('%d/%d blocks read.' % (n, len(offsets)))
+        for page in pages(io.BytesIO(read_stream(f, offset))):
+            yield page
+
+
+def _extract_popular(wiki_pages, popular, outfile):
+    """Extracts the pages whose title is in `popular`, removing them from it.
+
+    If `popular` is None every page is extracted.
+
+    Returns:
+        tuple[int, int]: Number of pages extracted and number of pages read.
+    """
+    num_texts, n = 0, 0
+    for n, page in enumerate(wiki_pages, 1):
+        if n % 10000 == 0:
+            logger.debug('%d pages processed (found: %d).' % (n, num_texts))
+
+        title = page['title']
+        if '&' in title:
+            title = html.unescape(title)
+        if popular is not None:
+            if title not in popular:
+                continue
+            popular.discard(title)
+
+        Extractor(page['id'], 1, title, page['text']).extract(outfile)
+        num_texts += 1
+        if popular is not None and not popular:
+            logger.debug('All popular pages found, stopping early.')
+            break
+    return num_texts, n
+
+
+_dump_file = None
+
+
+def _init_extract_worker(dump_path):
+    global _dump_file
+    _dump_file = open(dump_path, 'rb')
+
+
+def _extract_shard(args):
+    """Pool worker: extracts the wanted pages of a range of blocks to a shard.
+
+    Returns:
+        tuple: Shard path, titles found, pages extracted and pages read.
+    """
+    shard_path, blocks = args
+    wanted = None
+    if blocks[0][1] is not None:
+        wanted = set(t for _, titles in blocks for t in titles)
+    found = None if wanted is None else set(wanted)
+    with open(shard_path, 'w') as outfile:
+        num_texts, n = _extract_popular(
+            multistream_pages(_dump_file, [b[0] for b in blocks]),
+            wanted, outfile
+        )
+    if found is not None:
+        found -= wanted
+    return shard_path, found, num_texts, n
+
+
+def _extract_parallel(dump_path, blocks, txt_file_path, popular,
+                      processes=None, blocks_per_shard=50):
+    """Extracts `blocks` across a process pool, one output shard per task.
+
+    The shards are appended to `txt_file_path` in dump order as they finish,
+    and found titles are removed from `popular`.
+
+    Returns:
+        tuple[int, int]: Number of pages extracted and number of pages read.
+    """
+    blocks = list(blocks.items())
+    tasks = [
+        ('%s.%06d' % (txt_file_path, n), blocks[i:i + blocks_per_shard])
+        for n, i in enumerate(range(0, len(blocks), blocks_per_shard))
+    ]
+    logger.info('Extracting %d blocks in %d shards.', len(blocks), len(tasks))
+    num_texts, num_pages = 0, 0
+    with Pool(processes, initializer=_init_extract_worker,
+              initargs=(dump_path,)) as pool, \
+            open(txt_file_path, 'w') as outfile:
+        for shard_path, found, texts, n in pool.imap(_extract_shard, tasks):
+            with open(shard_path, 'r') as shard:
+                shutil.copyfileobj(shard, outfile)
+            os.remove(shard_path)
+            if found is not None:
+                popular -= found
+            num_texts += texts
+            num_pages += n
+    return num_texts, num_pages
+
+
+def wiki_xml_dump(txt_file_path: str, min_count=50, num_hours=12,
+                  titles_path=None, use_index=True, processes=1,
+                  blocks_per_shard=50):
+    """Extracts the text of every popular wiki page from the xml dump.
+
+    Args:
+        txt_file_path (str): Path the extracted documents are written to.
+        min_count (int): Minimum number of views for a page to be extracted.
+            If None, every article in the dump is extracted.
+        num_hours (int): Number of hourly pageview files to aggregate.
+        titles_path (str): Optional file to persist the popular titles to (see
+            `popular_titles`).
+        use_index (bool): Use the multistream index to seek straight to, and
+            only decompress, the bz2 blocks holding popular pages. Otherwise
+            the whole dump is decompressed and scanned.
+        processes (int): Number of worker processes. If not 1, ranges of
+            `blocks_per_shard` bz2 blocks are decompressed, parsed and
+            extracted by a process pool (this always uses the index) and the
+            shards are merged in dump order. `None` uses one per core.
+        blocks_per_shard (int): Number of bz2 blocks per pool task.
+
+    Returns:
+        set[str]: The popular titles that were not found in the dump.
+    """
     url = "https://dumps.wikimedia.org/enwiki/latest/enwiki-latest-pages-" \
           "articles-multistream.xml.bz2"
-    with bz2.open(maybe_download(url)) as f:
-        num_texts = 0
-        popular = [
-            v[0].decode('utf-8').replace('_', ' ')
-            for v in wiki_page_counts(min_count=min_count, num_hours=num_hours)
-        ]
-        with open(txt_file_path, 'w') as outfile:
-            for n, page in enumerate(pages(f)):
-                if n % 10000 == 0:
-                    logger.debug(
-                        '%d pages processed (found: %d).' % (n, num_texts)
-                    )
-
-                if page['title'] not in popular:
-                    continue
+    index_url = "https://dumps.wikimedia.org/enwiki/latest/enwiki-latest-" \
+                "pages-articles-multistream-index.txt.bz2"
+    sums_url = "https://dumps.wikimedia.org/enwiki/latest/enwiki-latest-" \
+               "md5sums.txt"
+    popular = None
+    if min_count is not None:
+        popular = popular_titles(min_count, num_hours, path=titles_path)
 
-                popular.remove(page['title'])
-                Extractor(
-                    page['id'], 1, page['title'], page['text']
-                ).extract(outfile)
-                num_texts += 1
+    with maybe_download(url, sums_url=sums_url) as f:
+        if use_index or processes != 1:
+            index = maybe_download(index_url, sums_url=sums_url)
+            with bz2.open(index) as index_file:
+                blocks = multistream_blocks(index_file, popular)
+            logger.info('Pages to extract found in %d multistream blocks.',
+                        len(blocks))
+
+        if processes != 1:
+            num_texts, n = _extract_parallel(
+                f.name, blocks, txt_file_path, popular, processes,
+                blocks_per_shard
+            )
+        else:
+            if use_index:
+                wiki_pages = multistream_pages(f, list(blocks))
+            else:
+                wiki_pages = pages(bz2.open(f))
+            with open(txt_file_path, 'w') as outfile:
+                num_texts, n = _extract_popular(wiki_pages, popular, outfile)
+        logger.info("%d pages with content extracted from %d." %
+                    (num_texts, n))
 
-            logger.info("%d pages with content extracted from %d." %
-                        (num_texts, n))
+    if popular:
+        logger.warning("%d popular titles not found in the dump.",
+                       len(popular))
+        logger.debug("Titles not found: %s", sorted(popular)[:50])
+    return popular
+
+
+def _tag_value(line, open_tag, close_tag):
+    """Returns the raw bytes between `open_tag` and the last `close_tag`."""
+    start = line.index(open_tag) + len(open_tag)
+    end = line.rfind(close_tag)
+    return line[start:end] if end >= start else line[start:].rstrip()
 
 
 def pages(f):
-    page = {'text': ''}
-    pos = 'o'
+    """Yields the main namespace (ns 0) pages of a wiki xml dump.
+
+    The dump is scanned line by line as raw bytes. Text lines (including the
+    enclosing <text> tags) are collected in a list and each page is decoded
+    once when it is yielded. Pages in other namespaces are skipped as soon as
+    their <ns> is seen, without buffering their text.
+
+    Args:
+        f: Binary file object of the uncompressed xml dump (or part of it).
+
+    Yields:
+        dict: The page's 'text', 'title', 'ns' and 'id'.
+    """
+    in_page, in_text = False, False
+    chunks, title, ns, page_id = [], b'', b'', b''
     for line in f:
-        if pos == 'o':
+        if in_text:
+            chunks.append(line)
+            if b'</text>' in line:
+                in_text = False
+            continue
+
+        if not in_page:
             if b'<page>' in line:
-                pos = 'i'
-            else:
+                in_page = True
+                chunks, title, ns, page_id = [], b'', b'', b''
+            continue
+
+        if b'<title>' in line:
+            title = _tag_value(line, b'<title>', b'</title>')
+
+        if b'<ns>' in line:
+            ns = _tag_value(line, b'<ns>', b'</ns>')
+            if ns != b'0':
+                in_page = False
                 continue
 
-        elif 'i' in pos:
-            if 'ii' in pos:
-                if b'</text>' in line:
-                    pos = 'i'
-                    page['text'] += line.decode('utf-8')
-                else:
-                    page['text'] += line.decode('utf-8')
+        if b'<id>' in line:
+            page_id = _tag_value(line, b'<id>', b'</id>')
+        elif b'</page>' in line:
+            in_page = False
+            yield {
+                'text': b''.join(chunks).decode('utf-8'),
+                'title': title.decode('utf-8'),
+                'ns': ns.decode('utf-8'),
+                'id': page_id.decode('utf-8')
+            }
+        elif b'<text' in line:
+            chunks.append(line)
+            in_text = not (b'</text>' in line or line.rstrip()[-2:] == b'/>')
 
-            else:
-                if b'<title>' in line:
-                    page['title'] = re.search(
-                        '<title>(.*)</title>', line.decode('utf-8')
-                    )[1]
-
-                if b'<ns>' in line:
-                    page['ns'] = re.search(
-                        '<ns>(.*)</ns>', line.decode('utf-8')
-                    )[1]
-                    if page['ns'] != '0':
-                        pos = 'o'
-                        page = {'text': ''}
-                        continue
-
-                if b'<id>' in line:
-                    page['id'] = re.search(
-                        '<id>(.*)</id>', line.decode('utf-8')
-                    )[1]
-                elif b'</page>' in line:
-                    pos = 'o'
-                    yield(page)
-                    page = {'text': ''}
-                elif b'<text' in line:
-                    page['text'] += line.decode('utf-8')
-                    pos = 'ii'
-
-
-def text_from_page(page):
-    page['text'] = re.sub(r'\{\{[^{]+?\}\}', r'', page['text'])
-    page['text'] = re.sub(r"\[\[File:.*\]\]", r'', page['text'])
-    page['text'] = re.sub(
-        r"\[\[[^\[]+\|(?P<word>[^\[]+)\]\]", r'\g<word>', page['text']
-    )
-    page['text'] = re.sub(
-        r"\[\[(?P<word>[^\[]+)\]\]", r'\g<word>', page['text']
-    )
-    page['text'] = re.sub(r"&quot;|\'{2,3}", r'"', page['text'])
-    page['text'] = re.sub(r" ?={2,4} ?", r'', page['text'])
-    page['text'] = re.sub(r"&lt;!--.*--&gt;", r'', page['text'])
-    page['text'] = re.sub(r'\n+', r'\n', page['text'])
-
-    if 'See also\n' in page['text']:
-        return page['text'][:page['text'].index('See also\n')]
-    if 'References\n' in page['text']:
-        return page['text'][:page['text'].index('References\n')]
-    else:
-        return None
+
+class WikiTextCleaner(object):
+    """Precompiled wikitext cleaner.
+
+    Applies the same rules, in the same order, as the original chain of
+    `re.sub` calls. Patterns are compiled once (some rewritten into equivalent
+    forms the regex engine can scan for faster) and a rule is skipped
+    entirely when its marker does not appear in the text. Instances hold no
+    state other than the compiled patterns, so they can be pickled and used
+    from a process pool.
+    """
+    templates = re.compile(r'\{\{[^{]+?\}\}')
+    files = re.compile(r"\[\[File:.*\]\]")
+    piped_links = re.compile(r"\[\[[^\[]+\|(?P<word>[^\[]+)\]\]")
+    links = re.compile(r"\[\[(?P<word>[^\[]+)\]\]")
+    quotes = re.compile(r"&quot;|''{1,2}")
+    headings = re.compile(r" ?={2,4} ?")
+    comments = re.compile(r"&lt;!--.*--&gt;")
+    newlines = re.compile(r"\n\n+")
+
+    def clean_text(self, text):
+        """Returns the cleaned wikitext (before any truncation)."""
+        if '{{' in text:
+            text = self.templates.sub('', text)
+        if '[[' in text:
+            if '[[File:' in text:
+                text = self.files.sub('', text)
+            if '|' in text:
+                text = self.piped_links.sub(r'\g<word>', text)
+            text = self.links.sub(r'\g<word>', text)
+        if '&quot;' in text or "''" in text:
+            text = self.quotes.sub('"', text)
+        if '==' in text:
+            text = self.headings.sub('', text)
+        if '&lt;!--' in text:
+            text = self.comments.sub('', text)
+        if '\n\n' in text:
+            text = self.newlines.sub('\n', text)
+        return text
+
+    @staticmethod
+    def truncate(text):
+        """Returns `text` up to its See also (or References) section."""
+        end = text.find('See also\n')
+        if end < 0:
+            end = text.find('References\n')
+        return text[:end] if end >= 0 else None
+
+    def __call__(self, page):
+        """Cleans `page['text']` in place and returns the truncated text."""
+        page['text'] = self.clean_text(page['text'])
+        return self.truncate(page['text'])
+
+    def clean_pages(self, wiki_pages):
+        """Cleans a batch of pages, returning a list of truncated texts."""
+        return [self(page) for page in wiki_pages]
+
+
+text_from_page = WikiTextCleaner()
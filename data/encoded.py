@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Integer-encoded corpus for training pipelines.
+
+Encoding a corpus tokenizes every document once (see `data.tokenizer`) and
+maps its words to ids, so training needs no string work at all. The result is
+a directory of `.npy` arrays that are memory-mapped when loaded:
+    - tokens.npy: int32 id of every word, in corpus order
+    - sentences.npy: uint64 offset of each sentence's first token, plus the
+      number of tokens
+    - paragraphs.npy: uint64 offset of each paragraph's first sentence, plus
+      the number of sentences
+    - documents.npy: uint64 offset of each document's first paragraph, plus
+      the number of paragraphs
+    - meta.json: the corpus fingerprint, sentence segmenter and vocab hash it
+      was encoded with
+
+Documents are numbered in file order, as in `data.structures.CorpusIndex`.
+
+"""
+import os
+import json
+import glob
+import shutil
+import hashlib
+import logging
+import numpy as np
+from utils import TMP_DIR
+from data.structures import read_documents, corpus_fingerprint
+from data.tokenizer import word_ids, get_segmenter
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+ARRAYS = [('tokens', np.int32), ('sentences', np.uint64),
+          ('paragraphs', np.uint64), ('documents', np.uint64)]
+
+
+def vocab_hash(word2int):
+    """Returns a hash of a word to id mapping."""
+    h = hashlib.sha1()
+    for word, n in sorted(word2int.items(), key=lambda w: w[1]):
+        h.update(('%d %s\n' % (n, word)).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+class _ArrayWriter(object):
+    """Appends to a 1-d array on disk whose final length isn't known."""
+    def __init__(self, path, dtype, first=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self.f = open(path + '.raw', 'wb')
+        if first is not None:
+            self.append([first])
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        self.f.write(values.tobytes())
+        self.length += len(values)
+
+    def close(self, chunk_size=1 << 24):
+        """Writes the `.npy` file and removes the raw data."""
+        self.f.close()
+        out = np.lib.format.open_memmap(self.path, mode='w+',
+                                        dtype=self.dtype,
+                                        shape=(self.length,))
+        if self.length:
+            raw = np.memmap(self.path + '.raw', dtype=self.dtype, mode='r')
+            for start in range(0, self.length, chunk_size):
+                out[start:start + chunk_size] = raw[start:start + chunk_size]
+            del raw
+        out.flush()
+        del out
+        os.remove(self.path + '.raw')
+
+
+def encode_corpus(word2int, out_dir, path=TMP_DIR + 'texts.txt'):
+    """Encodes a corpus file as token id arrays (see module docstring).
+
+    The arrays are written to a temporary directory that is renamed to
+    `out_dir` when done, so a reader never sees a partial encoding.
+
+    Args:
+        word2int (dict): Word ids, words not in it are encoded as 0.
+        out_dir (str): Directory to write the arrays to.
+        path (str): Path of the corpus file.
+    """
+    tmp_dir = out_dir.rstrip('/') + '.tmp/'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    tokens = _ArrayWriter(tmp_dir + 'tokens.npy', np.int32)
+    sentences = _ArrayWriter(tmp_dir + 'sentences.npy', np.uint64, 0)
+    paragraphs = _ArrayWriter(tmp_dir + 'paragraphs.npy', np.uint64, 0)
+    documents = _ArrayWriter(tmp_dir + 'documents.npy', np.uint64, 0)
+
+    num_docs = 0
+    for doc in read_documents(path):
+        tokenized = doc.tokenize()
+        first_token = tokens.length
+        first_sentence = sentences.length - 1
+        tokens.append(word_ids(tokenized.words(), word2int))
+        sentences.append(np.asarray(tokenized.sent_words[1:]) + first_token)
+        paragraphs.append(np.asarray(tokenized.para_sents[1:]) +
+                          first_sentence)
+        documents.append([paragraphs.length - 1])
+        num_docs += 1
+        if num_docs % 10000 == 0:
+            logger.debug('Encoded %d documents' % num_docs)
+
+    for writer in (tokens, sentences, paragraphs, documents):
+        writer.close()
+    with open(tmp_dir + 'meta.json', 'w') as f:
+        json.dump({
+            'version': VERSION,
+            'corpus': corpus_fingerprint(path),
+            'segmenter': get_segmenter().name,
+            'vocab': vocab_hash(word2int),
+            'num_words': len(word2int) + 1,
+        }, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp_dir, out_dir)
+    logger.info("Encoded %d documents (%d tokens) to %s.", num_docs,
+                tokens.length, out_dir)
+
+
+class EncodedCorpus(object):
+    """Memory-mapped token id arrays written by `encode_corpus`.
+
+    Args:
+        path (str): Directory holding the arrays.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != VERSION:
+            raise ValueError("%s is not a version %d encoded corpus." %
+                             (path, VERSION))
+        for name, dtype in ARRAYS:
+            array = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+            if array.dtype != dtype:
+                raise ValueError("%s/%s.npy has dtype %s, expected %s." %
+                                 (path, name, array.dtype, np.dtype(dtype)))
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.documents) - 1
+
+    def check_vocab(self, word2int):
+        """Raises ValueError if encoded with a different `word2int`."""
+        if self.meta['vocab'] != vocab_hash(word2int):
+            raise ValueError("%s was encoded with a different vocab." %
+                             self.path)
+
+    def document_sentences(self, n):
+        """Returns the range of sentence indices of document `n`."""
+        first, last = int(self.documents[n]), int(self.documents[n + 1])
+        return range(int(self.paragraphs[first]),
+                     int(self.paragraphs[last]))
+
+    def document_tokens(self, n):
+        """Returns the token ids of document `n`."""
+        sents = self.document_sentences(n)
+        return self.tokens[int(self.sentences[sents.start]):
+                           int(self.sentences[sents.stop])]
+
+    def sentence_chunks(self, max_tokens=1 << 24):
+        """Yields (tokens, sentence lengths) of runs of whole sentences.
+
+        Each run holds at most `max_tokens` tokens (unless a single sentence
+        is longer), so the whole corpus never has to be in memory at once.
+        """
+        offsets = self.sentences
+        start = 0
+        while start < len(offsets) - 1:
+            end = np.uint64(int(offsets[start]) + max_tokens)
+            stop = int(np.searchsorted(offsets, end, side='right')) - 1
+            stop = min(max(stop, start + 1), len(offsets) - 1)
+            bounds = np.asarray(offsets[start:stop + 1], dtype=np.int64)
+            yield (np.asarray(self.tokens[bounds[0]:bounds[-1]]),
+                   np.diff(bounds))
+            start = stop
+
+
+def encoded_corpus(word2int, path=TMP_DIR + 'texts.txt'):
+    """Returns the EncodedCorpus of a corpus, encoding it only if needed.
+
+    The encoding is kept next to the corpus, in
+    `<path>.encoded-<fingerprint>-<segmenter>-<vocab hash>/`. Encodings of
+    older versions of the corpus are removed when a new one is written.
+
+    Args:
+        word2int (dict): Word ids to encode with.
+        path (str): Path of the corpus file.
+    """
+    prefix = '%s.encoded-%s-%s-' % (path, corpus_fingerprint(path),
+                                    get_segmenter().name)
+    out_dir = prefix + vocab_hash(word2int) + '/'
+    if os.path.exists(out_dir):
+        logger.info("Using encoded corpus %s.", out_dir)
+        return EncodedCorpus(out_dir)
+
+    for old in glob.glob(glob.escape(path) + '.encoded-*/'):
+        if old.startswith(prefix):
+            continue
+        logger.info("Removing old encoded corpus %s.", old)
+        shutil.rmtree(old, ignore_errors=True)
+    encode_corpus(word2int, out_dir, path)
+    return EncodedCorpus(out_dir)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Sentence segmenters used by the tokenizer (see data.tokenizer).
+
+A segmenter splits paragraphs into sentences. Sentences don't include their
+terminating punctuation or the whitespace after it, and empty sentences are
+dropped.
+
+Currently implemented:
+    - RuleSegmenter: splits after `.`, `?` and `!` unless the next sentence
+      would start in lowercase or the period ends an abbreviation or initial
+      (the default)
+    - RegexSegmenter: splits on one regex, by default the original `. ` rule
+
+The segmenter used by every tokenization is set with
+`data.tokenizer.set_segmenter`.
+Benchmark and compare segmenters with `example_bench_segmenter.py`.
+
+"""
+import re
+import hashlib
+from abc import ABC, abstractmethod
+
+DEFAULT_PATTERN = r'(?<=[\)\]\w])\. '
+
+# Abbreviations that precede a name or another word, and so never end a
+# sentence.
+ABBREVIATIONS = frozenset([
+    'mr', 'mrs', 'ms', 'messrs', 'dr', 'prof', 'st', 'mt', 'gen', 'capt',
+    'lt', 'sgt', 'gov', 'sen', 'rev', 'hon', 'pres', 'vs', 'v', 'cf', 'wm',
+])
+
+# Abbreviations that are also words, or often end a sentence, so they only
+# don't end one when the next word isn't capitalised (a number, say).
+AMBIGUOUS_ABBREVIATIONS = frozenset([
+    'jr', 'sr', 'col', 'rep', 'etc', 'al', 'approx', 'ca', 'no', 'nos',
+    'vol', 'vols', 'pp', 'ed', 'eds', 'fig', 'figs', 'op', 'cit', 'ibid',
+    'inc', 'ltd', 'co', 'corp', 'bros', 'dept', 'univ', 'assn', 'est', 'jan',
+    'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov',
+    'dec', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun', 'ave', 'blvd',
+    'rd', 'mts', 'ft', 'b', 'd', 'c', 'n', 'p', 'km', 'mi', 'oz', 'lb',
+    'lbs', 'sq',
+])
+
+
+class SentenceSegmenter(ABC):
+    """Abstract base sentence segmenter.
+
+    Attributes:
+        name (str): Identifies the segmenter (and its settings) in the keys
+            of artifacts built from its sentences.
+    """
+    name = None
+
+    @abstractmethod
+    def split(self, paragraph):
+        """Returns the sentences of `paragraph`."""
+        pass
+
+    def split_batch(self, paragraphs):
+        """Returns the sentences of every paragraph in `paragraphs`."""
+        split = self.split
+        return [split(p) for p in paragraphs]
+
+
+class RegexSegmenter(SentenceSegmenter):
+    """Splits sentences on a regex.
+
+    Args:
+        pattern (str): The separator, by default `. ` after a word character
+            or closing bracket (the original rule).
+    """
+    def __init__(self, pattern=DEFAULT_PATTERN):
+        self.pattern = re.compile(pattern)
+        self.name = 'regex'
+        if pattern != DEFAULT_PATTERN:
+            self.name += '-' + hashlib.sha1(pattern.encode()).hexdigest()[:8]
+
+    def split(self, paragraph):
+        return [s for s in self.pattern.split(paragraph) if s]
+
+
+class RuleSegmenter(SentenceSegmenter):
+    """Rule based, abbreviation aware sentence segmenter.
+
+    A sentence ends at a run of `.`, `?` or `!` (and any closing quotes or
+    brackets) followed by whitespace or the end of the paragraph, unless:
+        - the next sentence would start with a lowercase letter
+        - a single `.` follows
+            - an initial (a single uppercase letter), except for the Roman
+              numerals I, V and X when no initial follows (`World War I.`)
+            - an abbreviation in `abbreviations`
+            - an abbreviation in `ambiguous`, and the next sentence wouldn't
+              start with an uppercase letter
+            - a word of one or two letter parts joined by periods (`e.g`,
+              `U.S`, `Ph.D`, but not `www.example.com`)
+
+    Args:
+        abbreviations (set[str]): Lowercase abbreviations (without the period)
+            that don't end a sentence.
+        ambiguous (set[str]): Lowercase abbreviations that only don't end a
+            sentence before a word that isn't capitalised.
+    """
+    name = 'rules3'
+    boundary = re.compile(r'([.?!]+)["\'\)\]]*(?:\s+|$)')
+    initial = re.compile(r'[A-Z]\.')
+
+    def __init__(self, abbreviations=ABBREVIATIONS,
+                 ambiguous=AMBIGUOUS_ABBREVIATIONS):
+        self.abbreviations = abbreviations
+        self.ambiguous = ambiguous
+        if abbreviations is not ABBREVIATIONS or \
+                ambiguous is not AMBIGUOUS_ABBREVIATIONS:
+            self.name += '-' + hashlib.sha1(
+                (' '.join(sorted(abbreviations)) + '|' +
+                 ' '.join(sorted(ambiguous))).encode()
+            ).hexdigest()[:8]
+
+    def _is_abbreviation(self, paragraph, start, end, following):
+        # The word starts after the last space in the sentence, or at the
+        # sentence's start if it is the first word.
+        word_start = max(start, paragraph.rfind(' ', start, end) + 1)
+        word = paragraph[word_start:end].lstrip('"\'([')
+        lower = word.lower()
+        if len(word) == 1 and word.isupper():
+            return word not in 'IVX' or \
+                self.initial.match(paragraph, following) is not None
+        if lower in self.abbreviations:
+            return True
+        if lower in self.ambiguous:
+            return not paragraph[following:following + 1].isupper()
+        return '.' in word and all(part.isalpha() and len(part) <= 2
+                                   for part in word.split('.'))
+
+    def split(self, paragraph):
+        sentences = []
+        start = 0
+        for m in self.boundary.finditer(paragraph):
+            end = m.start()
+            if m.end() < len(paragraph):
+                if paragraph[m.end()].islower():
+                    continue
+                if m.group(1) == '.' and \
+                        self._is_abbreviation(paragraph, start, end, m.end()):
+                    continue
+            if end > start:
+                sentences.append(paragraph[start:end])
+            start = m.end()
+        if start < len(paragraph):
+            sentences.append(paragraph[start:])
+        return sentences
@@ -12,20 +12,34 @@ By order of size, with each one containing the next, the data structures are:
 These structures are stored as nodes in the graph database.
 
 """
+import os
 import re
+import glob
+import mmap
+import hashlib
 import logging
+from array import array
+from itertools import accumulate, chain
 from abc import ABC, abstractmethod
-from collections import Counter
+from functools import reduce
+from multiprocessing import Pool
+import numpy as np
 from utils import TMP_DIR
+from data.vocab import Vocab
+from data.tokenizer import TokenizedText, TOKEN_CACHE, get_segmenter
+from data.tokenizer import WORD_SPLIT, paragraph_texts
 
 logger = logging.getLogger(__name__)
 
 
 class Structure(ABC):
-    """The abstract base structure class"""
+    """The abstract base structure class.
 
-    def __init__(self, class_name):
-        self.class_name = class_name
+    Structures use `__slots__` so that many of them can be held in memory,
+    and `class_name` is a class attribute rather than stored per instance.
+    """
+    __slots__ = ()
+    class_name = None
 
     @property
     @abstractmethod
@@ -35,11 +49,11 @@ class Structure(ABC):
 
 class Corpus(Structure):
     """"""
+    __slots__ = ('name',)
     class_name = "Corpora"
 
     def __init__(self, name):
         self.name = name
-        super(Corpus, self).__init__(self.class_name)
 
     @abstractmethod
     def text(self):
@@ -47,92 +61,171 @@ class Corpus(Structure):
 
 
 class Document(Structure):
-    """"""
+    """A document from texts.txt (`text`), the database (`paragraphs`) or
+    any list of paragraph texts (`Document.from_paragraphs`).
+
+    Only the document's text is kept: the body of a texts.txt document as one
+    string, and the paragraphs of other documents concatenated into one
+    buffer with an array of offsets (and one of paragraph node ids), rather
+    than the neo4j records themselves.
+    """
+    __slots__ = ('id', 'title', 'bowv', '_body', '_para_offsets',
+                 '_para_ids')
     class_name = "Document"
 
     def __init__(self, text=None, paragraphs=None, node_id=None, title=None,
                  **kwargs):
         self.id = node_id
+        self.bowv = kwargs.get("bowv")
         if node_id is None:
             lines = text.split('\n')
             self.title = re.search(r'title="(.*)"', lines[0])[1]
-            self._text = lines[3:-1]
+            self._body = '\n'.join(lines[3:-1])
+            self._para_offsets = self._para_ids = None
         else:
-            self.paras = paragraphs
             self.title = title
-            self._text = None
-            self.bowv = kwargs.get("bowv")
-        super(Document, self).__init__(self.class_name)
+            paragraphs = paragraphs or []
+            self._set_paragraphs([p.get('text') or '' for p in paragraphs],
+                                 [p.id for p in paragraphs])
+
+    @staticmethod
+    def from_paragraphs(texts, title, node_id=None, paragraph_ids=None,
+                        bowv=None):
+        """Returns a Document of paragraph texts from any other source.
+
+        Args:
+            texts (list[str]): The paragraph texts.
+            title (str): The document title.
+            node_id (int): The document's database node id, if any.
+            paragraph_ids (list[int]): The paragraphs' node ids, if any.
+            bowv (list[float]): The document's bag of words vector, if any.
+        """
+        doc = Document.__new__(Document)
+        doc.id = node_id
+        doc.title = title
+        doc.bowv = bowv
+        doc._set_paragraphs(texts, paragraph_ids)
+        return doc
+
+    def _set_paragraphs(self, texts, paragraph_ids):
+        self._body = ''.join(texts)
+        self._para_offsets = array(
+            'q', accumulate(chain([0], map(len, texts)))
+        )
+        self._para_ids = None if paragraph_ids is None else \
+            array('q', paragraph_ids)
+
+    def _cache_key(self):
+        if self._para_offsets is None:
+            return 'lines', self._body
+        return 'paragraphs', self._body, self._para_offsets.tobytes()
+
+    def _paragraph_texts(self):
+        if self._para_offsets is None:
+            return paragraph_texts(self._body.split('\n'))
+        offsets = self._para_offsets
+        return [self._body[offsets[n]:offsets[n + 1]]
+                for n in range(len(offsets) - 1)]
+
+    def tokenize(self):
+        """Splits the whole document into paragraphs, sentences and words.
+
+        The result is memoized in `TOKEN_CACHE` when it is enabled.
+
+        Returns:
+            TokenizedText: The tokenization the structures below are views
+                of.
+        """
+        return TOKEN_CACHE.get(
+            self._cache_key(), lambda: TokenizedText(self._paragraph_texts())
+        )
 
     def paragraphs(self):
-        if self.id is None:
-            txt = ''
-            for line in self._text:
-                if len(line) > 0:
-                    txt += (line+' ')
-                elif len(txt) > 0:
-                    yield Paragraph(txt)
-                    txt = ''
+        if TOKEN_CACHE.max_bytes:
+            # Views of the cached tokenization, so the paragraphs' words
+            # don't have to be split again.
+            tokens = self.tokenize()
+            texts = [None] * tokens.num_paragraphs
         else:
-            for p in self.paras:
-                yield Paragraph(
-                    text=p.get('text'),
-                    id=p.id
-                )
+            tokens, texts = None, self._paragraph_texts()
+        for n, text in enumerate(texts):
+            yield Paragraph(
+                text=text,
+                id=None if self._para_ids is None else self._para_ids[n],
+                tokens=tokens,
+                index=None if tokens is None else n
+            )
 
     @property
     def text(self):
-        return '\n'.join([p.text for p in self.paragraphs()])
+        if TOKEN_CACHE.max_bytes:
+            return '\n'.join(self.tokenize().paragraphs)
+        return '\n'.join(self._paragraph_texts())
 
     def words(self, lower=False):
-        for para in self.paragraphs():
-            for w in para.words(lower):
-                yield w
+        return self.tokenize().words(lower)
 
 
 class Paragraph(Structure):
     """"""
+    __slots__ = ('id', '_text', '_tokens', '_index')
     class_name = "Paragraph"
 
-    def __init__(self, text, id=None):
+    def __init__(self, text, id=None, tokens=None, index=None):
         self._text = text
         self.id = id
-        super(Paragraph, self).__init__(self.class_name)
+        self._tokens = tokens
+        self._index = 0 if index is None else index
 
     @property
     def text(self):
+        if self._text is None:
+            self._text = self._tokens.paragraphs[self._index]
         return self._text
 
+    def tokenize(self):
+        """Returns the TokenizedText this paragraph is in.
+
+        A paragraph that isn't a view of one is tokenized on every call
+        (unless `TOKEN_CACHE` is enabled), so that holding paragraphs doesn't
+        hold their words.
+        """
+        if self._tokens is None:
+            return TOKEN_CACHE.get(('paragraph', self.text),
+                                   lambda: TokenizedText([self.text]))
+        return self._tokens
+
     def sentences(self):
-        for s in re.split(r'(?<=[\)\]\w])\. ', self.text):
-            if len(s) > 0:
-                yield Sentence(s)
+        tokens = self.tokenize()
+        for n in tokens.sentence_range(self._index):
+            yield Sentence(None, tokens=tokens, index=n)
 
     def words(self, lower=False):
-        for sent in self.sentences():
-            for w in sent.words(lower):
-                yield w
+        return self.tokenize().paragraph_words(self._index, lower)
 
 
 class Sentence(Structure):
     """"""
+    __slots__ = ('_text', '_tokens', '_index')
     class_name = "Sentence"
 
-    def __init__(self, text):
+    def __init__(self, text, tokens=None, index=None):
         self._text = text
-        super(Sentence, self).__init__(self.class_name)
+        self._tokens = tokens
+        self._index = index
 
     @property
     def text(self):
+        if self._text is None:
+            self._text = self._tokens.sentences[self._index]
         return self._text
 
     def words(self, lower=False):
+        if self._tokens is not None:
+            return self._tokens.sentence_words(self._index, lower)
         if lower:
-            for w in re.split(r'\W+', self.text):
-                yield w.lower()
-        else:
-            for w in re.split(r'\W+', self.text):
-                yield w
+            return (w.lower() for w in WORD_SPLIT.split(self.text))
+        return iter(WORD_SPLIT.split(self.text))
 
 
 def get_documents():
@@ -149,15 +242,315 @@ def get_documents():
                 txt = ''
 
 
-def get_vocab(size=50000):
+class CorpusIndex(object):
+    """Offset index over an extracted corpus file (`texts.txt`).
+
+    The index is kept in a sidecar file (`<path>.idx` by default) with one
+    `doc_id, offset, length, title` line per document, after a header line
+    recording the corpus file's size and mtime. It is rebuilt automatically
+    when the corpus file changes. Documents are read through `mmap`, so any
+    one of them can be fetched without scanning the file.
+
+    Args:
+        path (str): Path of the corpus file.
+        index_path (str): Path of the sidecar index file.
+    """
+    header = re.compile(rb'<doc id="([^"]*)".* title="(.*)">')
+
+    def __init__(self, path=TMP_DIR + 'texts.txt', index_path=None):
+        self.path = path
+        self.index_path = index_path or path + '.idx'
+        self.doc_ids, self.offsets, self.lengths, self.titles = [], [], [], []
+        self._by_title = None
+        self._file, self._mmap = None, None
+        if not self._load():
+            self.build()
+
+    def _stamp(self):
+        stat = os.stat(self.path)
+        return '%d\t%d' % (stat.st_size, stat.st_mtime_ns)
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            if f.readline().rstrip('\n') != self._stamp():
+                logger.info("Corpus %s changed since it was indexed.",
+                            self.path)
+                return False
+            for line in f:
+                doc_id, offset, length, title = line.rstrip('\n').split(
+                    '\t', 3
+                )
+                self.doc_ids.append(doc_id)
+                self.offsets.append(int(offset))
+                self.lengths.append(int(length))
+                self.titles.append(title)
+        logger.debug("Loaded index of %d documents from %s.",
+                     len(self), self.index_path)
+        return True
+
+    def build(self):
+        """Scans the corpus file and writes the sidecar index."""
+        logger.info("Indexing documents in %s.", self.path)
+        self.doc_ids, self.offsets, self.lengths, self.titles = [], [], [], []
+        self._by_title = None
+        offset, start, match = 0, None, None
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'<doc '):
+                    if start is not None:
+                        logger.warning("Unterminated document at byte %d "
+                                       "of %s.", start, self.path)
+                    start = offset
+                    match = self.header.match(line)
+                offset += len(line)
+                if b'</doc>' in line and start is not None:
+                    # Only complete documents are indexed, so the columns
+                    # stay aligned if the file is truncated.
+                    self.doc_ids.append(match[1].decode('utf-8'))
+                    self.titles.append(match[2].decode('utf-8'))
+                    self.offsets.append(start)
+                    self.lengths.append(offset - start)
+                    start = None
+        if start is not None:
+            logger.warning("Unterminated document at byte %d of %s.",
+                           start, self.path)
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            f.write(self._stamp() + '\n')
+            for row in zip(self.doc_ids, self.offsets, self.lengths,
+                           self.titles):
+                f.write('%s\t%d\t%d\t%s\n' % row)
+        logger.info("Indexed %d documents.", len(self))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _buffer(self):
+        if self._mmap is None:
+            self._file = open(self.path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def text(self, n):
+        """Returns the raw text (header to footer) of document `n`."""
+        start = self.offsets[n]
+        return self._buffer()[start:start + self.lengths[n]].decode('utf-8')
+
+    def __getitem__(self, n):
+        return Document(self.text(n))
+
+    def index_of(self, title):
+        """Returns the number of the document with `title` (None if absent).
+        """
+        if self._by_title is None:
+            self._by_title = {t: n for n, t in enumerate(self.titles)}
+        return self._by_title.get(title)
+
+    def get_document_from_title(self, title):
+        n = self.index_of(title)
+        return None if n is None else self[n]
+
+    def documents(self, start=0, stop=None):
+        """Yields documents `start` to `stop` in file order."""
+        for n in range(start, len(self) if stop is None else stop):
+            yield self[n]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._file, self._mmap = None, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_documents(path, start=0, end=None):
+    """Yields the documents in the byte range [`start`, `end`) of a corpus.
+
+    `start` must be the offset of a `<doc ...>` line (or 0), and a document
+    starting before `end` is read to its end.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset, lines = start, []
+        for line in f:
+            if end is not None and offset >= end and not lines:
+                break
+            offset += len(line)
+            lines.append(line)
+            if b'</doc>' in line:
+                yield Document(b''.join(lines).decode('utf-8'))
+                lines = []
+
+
+def _map_shard(args):
+    fn, path, start, end = args
+    return fn(read_documents(path, start, end))
+
+
+class ShardedCorpus(object):
+    """A corpus file split into byte ranges that are processed in parallel.
+
+    The ranges are aligned to `<doc ...>` lines so every document falls in
+    exactly one shard. Functions passed to `map` and `map_reduce` are sent to
+    a process pool, so they must be picklable (defined at module level, or
+    methods of picklable objects).
+
+    Args:
+        path (str): Path of the corpus file.
+        num_shards (int): Number of byte ranges to split the file into,
+            defaults to 4 per core.
+        processes (int): Number of worker processes, defaults to one per core.
+    """
+    def __init__(self, path=TMP_DIR + 'texts.txt', num_shards=None,
+                 processes=None):
+        self.path = path
+        self.processes = processes or os.cpu_count()
+        self.num_shards = num_shards or 4 * self.processes
+        self.shards = self._split()
+
+    def _split(self):
+        size = os.path.getsize(self.path)
+        starts = set()
+        with open(self.path, 'rb') as f:
+            for n in range(self.num_shards):
+                f.seek(size * n // self.num_shards)
+                if n > 0:
+                    f.readline()
+                offset = f.tell()
+                for line in iter(f.readline, b''):
+                    if line.startswith(b'<doc '):
+                        starts.add(offset)
+                        break
+                    offset += len(line)
+        starts = sorted(starts)
+        return list(zip(starts, starts[1:] + [size]))
+
+    def documents(self):
+        """Yields every document in file order (in this process)."""
+        for start, end in self.shards:
+            for doc in read_documents(self.path, start, end):
+                yield doc
+
+    def map(self, fn):
+        """Applies `fn` to each shard's iterator of documents in a pool.
+
+        Returns:
+            list: The return value of `fn` for every shard, in file order.
+        """
+        tasks = [(fn, self.path, start, end) for start, end in self.shards]
+        logger.debug("Mapping %s over %d shards of %s.",
+                     getattr(fn, '__name__', fn), len(tasks), self.path)
+        with Pool(self.processes) as pool:
+            return pool.map(_map_shard, tasks, chunksize=1)
+
+    def map_reduce(self, fn, combine, initial=None):
+        """Maps `fn` over the shards and reduces the results with `combine`.
+
+        Args:
+            fn: Function from an iterator of documents to a partial result.
+            combine: Function of two partial results returning their
+                combination.
+            initial: Starting value for the reduction, and the result if
+                there are no shards. Without it an empty corpus raises
+                ValueError.
+        """
+        results = self.map(fn)
+        if initial is not None:
+            return reduce(combine, results, initial)
+        if not results:
+            raise ValueError("No documents in %s to reduce." % self.path)
+        return reduce(combine, results)
+
+
+def corpus_fingerprint(path=TMP_DIR + 'texts.txt'):
+    """Returns a fingerprint of a corpus file.
+
+    It combines the file's size and mtime with a hash of its CorpusIndex, so
+    it changes whenever the documents do.
+    """
+    index = CorpusIndex(path)
+    with open(index.index_path, 'rb') as f:
+        index_hash = hashlib.sha1(f.read()).hexdigest()
+    stat = os.stat(path)
+    return hashlib.sha1(
+        ('%d:%d:%s' % (stat.st_size, stat.st_mtime_ns, index_hash)).encode()
+    ).hexdigest()[:16]
+
+
+def corpus_vocab(path=TMP_DIR + 'texts.txt', processes=1, capacity=None):
+    """Returns the full Vocab of a corpus, counting it only if it changed.
+
+    The vocab is saved as a versioned artifact next to the corpus,
+    `<path>.vocab-<fingerprint>-<segmenter>.bin` (see `corpus_fingerprint`
+    and data.tokenizer.set_segmenter), and memory-mapped on later calls.
+    Artifacts of older versions of the corpus are removed when a new one is
+    built; those of the current version for other segmenters or capacities
+    are kept.
+
+    Args:
+        path (str): Path of the corpus file.
+        processes (int): If not 1, the corpus is counted shard by shard in a
+            process pool (see ShardedCorpus) and the counts merged.
+        capacity (int): If given, counters are pruned to this many words to
+            bound memory (see data.vocab.VocabCounter).
+    """
+    prefix = '%s.vocab-%s-' % (path, corpus_fingerprint(path))
+    vocab_path = prefix + get_segmenter().name
+    if capacity is not None:
+        vocab_path += '-%d' % capacity
+    vocab_path += '.bin'
+    if os.path.exists(vocab_path):
+        try:
+            vocab = Vocab.load(vocab_path)
+            logger.info("Using vocab artifact %s.", vocab_path)
+            return vocab
+        except ValueError as e:
+            logger.info("Rebuilding vocab artifact: %s", e)
+
+    if processes == 1:
+        vocab = Vocab.build(docs=read_documents(path), capacity=capacity)
+    else:
+        vocab = Vocab.build(corpus=ShardedCorpus(path, processes=processes),
+                            capacity=capacity)
+    for old_path in glob.glob(glob.escape(path) + '.vocab-*.bin'):
+        if old_path.startswith(prefix):
+            continue
+        logger.info("Removing old vocab artifact %s.", old_path)
+        os.remove(old_path)
+    vocab.save(vocab_path)
+    return vocab
+
+
+def get_vocab(size=50000, processes=1, capacity=None,
+              path=TMP_DIR + 'texts.txt'):
+    """Returns the `size` most common words and their counts in a corpus.
+
+    The counts come from the persisted vocab artifact (see `corpus_vocab`)
+    and are only recounted when the corpus has changed.
+
+    Args:
+        size (int): Number of words to return.
+        processes (int): Number of processes to count with, see corpus_vocab.
+        capacity (int): Pruning capacity, see corpus_vocab.
+        path (str): Path of the corpus file.
+
+    Returns:
+        list[tuple[str, int]]: (word, count) pairs, most common first.
+    """
     logger.info("Getting vocab counts.")
-    counts = Counter(w for d in get_documents()
-                     for p in d.paragraphs()
-                     for s in p.sentences() for w in s.words()).most_common()
+    vocab = corpus_vocab(path=path, processes=processes, capacity=capacity)
+    counts = vocab.most_common(size)
     logger.info("%d words in vocab (%d with more than 100 occurences). "
-                "Returning top %d" % (len(counts),
-                                      len([c for c in counts if c[1] > 100]),
+                "Returning top %d" % (len(vocab),
+                                      int(np.sum(vocab.counts > 100)),
                                       size))
     logger.debug('Most common words: %s' % counts[:50])
-    logger.debug('Least common words: %s' % counts[-50:])
-    return counts[:size]
+    logger.debug('Least common words: %s' % vocab.pairs(-50))
+    return counts
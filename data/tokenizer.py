@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Single pass tokenizer for the structures in data.structures.
+
+A document's paragraphs are split into sentences and words in a single pass,
+using the same rules as the original per-structure splitting:
+    - a paragraph is a run of non-empty lines, each followed by a space
+    - sentences are split by the current segmenter (see data.segmenter and
+      `set_segmenter`); the original rule split them on `. ` after a word
+      character or closing bracket
+    - words are split on runs of non-word characters (empty words are kept)
+
+Tokenizations can be memoized in `TOKEN_CACHE`, see `TokenCache`.
+
+The result is a `TokenizedText` holding flat lists of the sentences and words
+and arrays of where each paragraph's sentences and each sentence's words
+start. `Document`, `Paragraph` and `Sentence` are views over these.
+
+"""
+import re
+import sys
+import logging
+from array import array
+from collections import OrderedDict
+from itertools import repeat
+from data.segmenter import RuleSegmenter
+
+logger = logging.getLogger(__name__)
+
+WORD_SPLIT = re.compile(r'\W+')
+SEGMENTER = RuleSegmenter()
+
+
+def get_segmenter():
+    """Returns the sentence segmenter used by every tokenization."""
+    return SEGMENTER
+
+
+def set_segmenter(segmenter):
+    """Sets the sentence segmenter used by every tokenization.
+
+    Cached tokenizations are cleared. Vocab and encoded corpus artifacts are
+    keyed by the segmenter's `name`, so they are rebuilt as needed.
+    """
+    global SEGMENTER
+    SEGMENTER = segmenter
+    TOKEN_CACHE.clear()
+    logger.info("Using sentence segmenter %s.", segmenter.name)
+
+
+def paragraph_texts(lines):
+    """Returns the paragraph texts of a document's lines.
+
+    A paragraph is only complete once an empty line follows it.
+    """
+    paragraphs, para = [], []
+    for line in lines:
+        if line:
+            para.append(line)
+        elif para:
+            para.append('')
+            paragraphs.append(' '.join(para))
+            para = []
+    return paragraphs
+
+
+class TokenizedText(object):
+    """Paragraphs, sentences and words of a text, split once.
+
+    Args:
+        paragraphs (list[str]): The paragraph texts.
+
+    Attributes:
+        paragraphs (list[str]): The paragraph texts.
+        sentences (list[str]): Every sentence, in order.
+        para_sents (array): Index of each paragraph's first sentence, plus
+            the number of sentences.
+        word_list (list[str]): Every word, in order.
+        sent_words (array): Index of each sentence's first word, plus the
+            number of words.
+    """
+    __slots__ = ('paragraphs', 'sentences', 'para_sents', 'word_list',
+                 'sent_words', '_lower')
+
+    def __init__(self, paragraphs):
+        self.paragraphs = paragraphs
+        self.sentences, self.word_list = [], []
+        self.para_sents, self.sent_words = array('q', [0]), array('q', [0])
+        self._lower = None
+
+        sentences, word_list = self.sentences, self.word_list
+        for para in SEGMENTER.split_batch(paragraphs):
+            for sentence in para:
+                sentences.append(sentence)
+                word_list.extend(WORD_SPLIT.split(sentence))
+                self.sent_words.append(len(word_list))
+            self.para_sents.append(len(sentences))
+
+    @staticmethod
+    def from_lines(lines):
+        return TokenizedText(paragraph_texts(lines))
+
+    @property
+    def num_paragraphs(self):
+        return len(self.paragraphs)
+
+    def sentence_range(self, paragraph=None):
+        """Returns the range of sentence indices (in `paragraph`)."""
+        if paragraph is None:
+            return range(len(self.sentences))
+        return range(self.para_sents[paragraph],
+                     self.para_sents[paragraph + 1])
+
+    def lower_words(self):
+        """Returns the lowercased words, lowercasing them all at once."""
+        if self._lower is None:
+            # Words never contain a newline, so the joined words split back
+            # into the same number of words.
+            self._lower = '\n'.join(self.word_list).lower().split('\n')
+        return self._lower
+
+    def _words(self, start, end, lower):
+        words = self.lower_words() if lower else self.word_list
+        return iter(words[start:end])
+
+    def words(self, lower=False):
+        """Returns an iterator over every word."""
+        return iter(self.lower_words() if lower else self.word_list)
+
+    def sentence_words(self, n, lower=False):
+        """Returns an iterator over the words of sentence `n`."""
+        return self._words(self.sent_words[n], self.sent_words[n + 1], lower)
+
+    def paragraph_words(self, n, lower=False):
+        """Returns an iterator over the words of paragraph `n`."""
+        first, last = self.para_sents[n], self.para_sents[n + 1]
+        return self._words(self.sent_words[first], self.sent_words[last],
+                           lower)
+
+    def sentence_lengths(self):
+        """Returns the number of words in every sentence."""
+        return list(map(int.__sub__, self.sent_words[1:],
+                        self.sent_words[:-1]))
+
+    def nbytes(self):
+        """Returns an estimate of the memory held, in bytes.
+
+        The lowercased words are counted whether or not they have been
+        computed yet, as they are once `words(lower=True)` is called.
+        """
+        getsizeof = sys.getsizeof
+        words = sum(map(getsizeof, self.word_list)) + \
+            getsizeof(self.word_list)
+        return getsizeof(self) + 2 * words + \
+            sum(map(getsizeof, self.sentences)) + \
+            getsizeof(self.sentences) + \
+            sum(map(getsizeof, self.paragraphs)) + \
+            getsizeof(self.paragraphs) + \
+            getsizeof(self.para_sents) + getsizeof(self.sent_words)
+
+
+def word_ids(words, word2int, unknown=0):
+    """Maps words to their ids (`unknown` for words not in `word2int`)."""
+    return list(map(word2int.get, words, repeat(unknown)))
+
+
+class TokenCache(object):
+    """Bounded least recently used cache of TokenizedTexts.
+
+    Entries are keyed by the text they were tokenized from (see
+    `Document.tokenize`), so a structure whose text changes simply misses
+    the cache, and equal texts fetched again (as new structure objects) hit
+    it. Caching is off while `max_bytes` is 0.
+
+    The size of an entry is estimated from the sizes of its key and of the
+    strings, lists and arrays of its TokenizedText (see
+    `TokenizedText.nbytes`). Every word is a separate string object, so a
+    tokenization takes roughly 150 bytes per word of English text, some 30
+    times the size of the text itself.
+
+    Args:
+        max_bytes (int): Estimated total size in bytes the cached entries
+            may take before the least recently used are evicted.
+    """
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, tokenize):
+        """Returns the cached tokenization of `key`, or caches `tokenize()`.
+        """
+        if not self.max_bytes:
+            return tokenize()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        tokens = tokenize()
+        size = self._entry_size(key, tokens)
+        if size <= self.max_bytes:
+            self._entries[key] = tokens, size
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+        return tokens
+
+    @staticmethod
+    def _entry_size(key, tokens):
+        getsizeof = sys.getsizeof
+        return 100 + getsizeof(key) + sum(map(getsizeof, key)) + \
+            tokens.nbytes()
+
+    def clear(self):
+        logger.debug("Clearing token cache (%d hits, %d misses).",
+                     self.hits, self.misses)
+        self._entries.clear()
+        self.nbytes = self.hits = self.misses = 0
+
+
+TOKEN_CACHE = TokenCache()
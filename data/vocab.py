@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Vocabulary counting, merging and storage.
+
+Word counts are built per shard of a corpus (see `data.structures`) and the
+shard counts merged. When memory is tight a `capacity` can be given, in which
+case counters are pruned as in the space-saving sketch: only the `capacity`
+most frequent words are kept, and the largest count dropped becomes the
+floor a word not in the counter starts from when it is seen again. Counts
+are then overestimates by at most that floor (the error bound), and a word
+missing from the counter occurs at most that many times.
+
+A vocabulary is saved in a compact binary format that is memory-mapped when
+loaded, so even a large vocabulary is available without parsing it:
+    - 8 byte magic `NLPVOCAB`, uint32 version, uint64 number of words (n),
+      uint64 count error bound (maximum overcount)
+    - n int64 counts, most common first
+    - n + 1 uint64 byte offsets of the words in the word data
+    - utf-8 word data
+
+"""
+import os
+import struct
+import logging
+from collections import Counter
+from functools import partial
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'NLPVOCAB'
+VERSION = 3
+HEADER = struct.Struct('<8sIQQ')
+
+
+class VocabCounter(object):
+    """Mergeable word counter with optional space-saving pruning.
+
+    Once pruned, `error` is the most any count may overestimate the true
+    count by, and the most times a word missing from `counts` may occur.
+
+    Args:
+        capacity (int): Number of words to keep when pruning, None to keep
+            every word. Pruning happens once the counter holds twice this
+            many words.
+    """
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.error = 0
+
+    def update(self, words):
+        if self.error:
+            # A word that isn't counted may have been pruned with up to
+            # `error` occurrences, so it carries on from there.
+            words = list(words)
+            counts = self.counts
+            for word in set(words).difference(counts):
+                counts[word] = self.error
+        self.counts.update(words)
+        self._maybe_prune()
+
+    def merge(self, other):
+        """Adds the counts of another VocabCounter to this one.
+
+        A word missing from either counter is counted at that counter's
+        error bound, and the bounds add up.
+        """
+        counts = self.counts
+        if other.error:
+            for word in set(counts).difference(other.counts):
+                counts[word] += other.error
+        for word, count in other.counts.items():
+            counts[word] = counts.get(word, self.error) + count
+        self.error += other.error
+        self._maybe_prune()
+        return self
+
+    def _maybe_prune(self):
+        if self.capacity is not None and \
+                len(self.counts) > 2 * self.capacity:
+            self.prune()
+
+    def prune(self):
+        """Keeps only the `capacity` most common words."""
+        if self.capacity is None or len(self.counts) <= self.capacity:
+            return
+        common = self.counts.most_common()
+        self.error = max(self.error, common[self.capacity][1])
+        logger.debug("Pruned %d words with at most %d occurrences.",
+                     len(common) - self.capacity, common[self.capacity][1])
+        self.counts = Counter(dict(common[:self.capacity]))
+
+    def most_common(self, n=None):
+        return self.counts.most_common(n)
+
+
+def count_words(docs, capacity=None):
+    """Returns a VocabCounter of the words in `docs`."""
+    counter = VocabCounter(capacity)
+    for doc in docs:
+        counter.update(doc.words())
+    return counter
+
+
+def _merge(a, b):
+    return a.merge(b)
+
+
+class MappedWords(object):
+    """Read-only sequence of the words in a memory-mapped vocab file."""
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError('word index out of range')
+        start, end = self.offsets[n], self.offsets[n + 1]
+        return bytes(self.data[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+
+class Vocab(object):
+    """An ordered vocabulary of words and their counts, most common first.
+
+    Args:
+        words (list[str]): The words, most common first.
+        counts: Sequence of the words' counts.
+        error (int): Upper bound on how much any count was overcounted by
+            pruning, and on the count of any word left out (0 if the counts
+            are exact).
+    """
+    def __init__(self, words, counts, error=0):
+        self.words = words
+        self.counts = counts
+        self.error = error
+
+    def __len__(self):
+        return len(self.words)
+
+    def most_common(self, n=None):
+        """Returns the (word, count) pairs of the `n` most common words."""
+        return self.pairs(0, n)
+
+    def pairs(self, start=0, stop=None):
+        """Returns the (word, count) pairs of words `start` to `stop`."""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return [(self.words[i], int(self.counts[i]))
+                for i in range(start, stop)]
+
+    @staticmethod
+    def from_counter(counter, size=None):
+        common = counter.most_common(size)
+        return Vocab([w for w, _ in common],
+                     np.array([c for _, c in common], dtype=np.int64),
+                     counter.error)
+
+    @staticmethod
+    def build(docs=None, corpus=None, size=None, capacity=None):
+        """Counts a vocabulary from `docs` or, in parallel, a ShardedCorpus.
+
+        Args:
+            docs: Iterable of documents, counted in this process.
+            corpus (data.structures.ShardedCorpus): Corpus whose shards are
+                counted in a process pool and merged.
+            size (int): Number of most common words to keep.
+            capacity (int): Number of words each counter may keep, see
+                VocabCounter. Should be well above `size`.
+        """
+        if corpus is not None:
+            counter = corpus.map_reduce(
+                partial(count_words, capacity=capacity), _merge,
+                VocabCounter(capacity)
+            )
+        else:
+            counter = count_words(docs, capacity)
+        counter.prune()
+        logger.debug("Counted %d words (error bound %d).",
+                     len(counter.counts), counter.error)
+        return Vocab.from_counter(counter, size)
+
+    def save(self, path):
+        """Saves the vocabulary in the compact binary format.
+
+        The file is written next to `path` and renamed into place, so a
+        reader never sees a partly written vocab.
+        """
+        words = [w.encode('utf-8') for w in self.words]
+        offsets = np.zeros(len(words) + 1, dtype='<u8')
+        np.cumsum([len(w) for w in words], out=offsets[1:])
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self), self.error))
+            f.write(np.asarray(self.counts, dtype='<i8').tobytes())
+            f.write(offsets.tobytes())
+            f.write(b''.join(words))
+        os.replace(tmp_path, path)
+        logger.info("Saved vocab of %d words to %s.", len(self), path)
+
+    @staticmethod
+    def load(path):
+        """Memory-maps a vocabulary saved with `save`."""
+        with open(path, 'rb') as f:
+            magic, version, n, error = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d vocab file." %
+                             (path, VERSION))
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        counts = data[HEADER.size:HEADER.size + 8 * n].view('<i8')
+        start = HEADER.size + 8 * n
+        offsets = data[start:start + 8 * (n + 1)].view('<u8')
+        words = MappedWords(data[start + 8 * (n + 1):], offsets)
+        logger.debug("Mapped vocab of %d words from %s.", n, path)
+        return Vocab(words, counts, error)
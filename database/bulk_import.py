@@ -0,0 +1,112 @@
+"""Export of the corpus as CSV files for `neo4j-admin import`.
+
+For the first load of a large corpus, the offline importer is much faster
+than any Cypher. The corpus is exported in parallel shards (see
+data.structures.ShardedCorpus) to node and relationship files, each with a
+separate header file:
+    - documents: `:ID(Document)`, `doc_id:long`, `title`
+    - paragraphs: `:ID(Paragraph)`, `pid:long`, `text`
+    - contains: `:START_ID(Document)`, `:END_ID(Paragraph)`
+
+Documents are numbered in file order and their paragraphs by their position
+in the document, exactly as example_db_upload.py and `GraphCon.add_documents`
+do, so the imported graph answers the same GraphCon queries. A paragraph's
+import id is `<doc_id>-<pid>`. The importer doesn't create indexes, so create
+the schema afterwards (see database.schema).
+
+"""
+import os
+import csv
+import glob
+import logging
+from bisect import bisect_left
+from multiprocessing import Pool
+from utils import TMP_DIR
+from data.structures import CorpusIndex, ShardedCorpus, read_documents
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    'documents': [':ID(Document)', 'doc_id:long', 'title'],
+    'paragraphs': [':ID(Paragraph)', 'pid:long', 'text'],
+    'contains': [':START_ID(Document)', ':END_ID(Paragraph)'],
+}
+
+
+def _export_shard(args):
+    path, start, end, first_id, out_dir, shard = args
+    files = {name: open(os.path.join(out_dir, '%s-%03d.csv' % (name, shard)),
+                        'w', newline='', encoding='utf-8')
+             for name in HEADERS}
+    writers = {name: csv.writer(f) for name, f in files.items()}
+    num_docs = num_paras = 0
+    try:
+        for did, doc in enumerate(read_documents(path, start, end), first_id):
+            writers['documents'].writerow([did, did, doc.title])
+            for pid, para in enumerate(doc.paragraphs()):
+                para_id = '%d-%d' % (did, pid)
+                writers['paragraphs'].writerow([para_id, pid, para.text])
+                writers['contains'].writerow([did, para_id])
+                num_paras += 1
+            num_docs += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return num_docs, num_paras
+
+
+def export_import_csv(out_dir=TMP_DIR + 'import/', path=TMP_DIR + 'texts.txt',
+                      num_shards=None, processes=4):
+    """Exports a corpus file as CSV files for `neo4j-admin import`.
+
+    Args:
+        out_dir (str): Directory to write the files to.
+        path (str): Path of the corpus file.
+        num_shards (int): Number of shards (files of each kind), by default
+            `processes`.
+        processes (int): Number of processes to export with.
+
+    Returns:
+        str: The `neo4j-admin import` command that imports the files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for name, header in HEADERS.items():
+        # Files of an earlier export would match the import command too.
+        for old_path in glob.glob(os.path.join(glob.escape(out_dir),
+                                               '%s-*.csv' % name)):
+            os.remove(old_path)
+        with open(os.path.join(out_dir, '%s-header.csv' % name), 'w',
+                  newline='') as f:
+            csv.writer(f).writerow(header)
+
+    with CorpusIndex(path) as index:
+        offsets = index.offsets
+    shards = ShardedCorpus(path, num_shards or processes, processes).shards
+    tasks = [(path, start, end, bisect_left(offsets, start), out_dir, n)
+             for n, (start, end) in enumerate(shards)]
+    logger.info("Exporting %d documents in %d shards to %s.", len(offsets),
+                len(tasks), out_dir)
+    with Pool(processes) as pool:
+        counts = pool.map(_export_shard, tasks, chunksize=1)
+    logger.info("Exported %d documents and %d paragraphs.",
+                sum(c[0] for c in counts), sum(c[1] for c in counts))
+
+    command = import_command(out_dir)
+    logger.info("Import with: %s", command)
+    return command
+
+
+def import_command(out_dir, database='graph.db'):
+    """Returns the `neo4j-admin import` command for files in `out_dir`."""
+    def files(name):
+        return '"%s"' % ','.join([
+            os.path.join(out_dir, '%s-header.csv' % name),
+            os.path.join(out_dir, r'%s-\d+\.csv' % name)
+        ])
+
+    return ' '.join([
+        'neo4j-admin import', '--database=%s' % database,
+        '--nodes:Document %s' % files('documents'),
+        '--nodes:Paragraph %s' % files('paragraphs'),
+        '--relationships:contains %s' % files('contains'),
+    ])
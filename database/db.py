@@ -1,31 +1,191 @@
-from itertools import zip_longest
-from neo4j import GraphDatabase
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from neo4j import GraphDatabase, READ_ACCESS, WRITE_ACCESS
+from neo4j.exceptions import ClientError
 from data.structures import Paragraph, Document
+from database.schema import SchemaManager
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def grouper(iterable, n, fillvalue=None):
-    """Collect data into fixed-length chunks or blocks
+def batches(iterable, n):
+    """Collect data into lists of at most n items.
 
     Examples:
-        grouper('ABCDEFG', 3, 'x') --> ABC DEF Gxx"
+        batches('ABCDEFG', 3) --> ABC DEF G
     """
-    args = [iter(iterable)] * n
-    return zip_longest(*args, fillvalue=fillvalue)
+    iterator = iter(iterable)
+    return iter(lambda: list(islice(iterator, n)), [])
+
+
+class QueryStats(object):
+    """Latency and pool wait of the GraphCon transactions, by query.
+
+    The latency of a transaction is the time from it starting to it being
+    committed (of its last attempt, if it was retried), the pool wait the
+    time from asking for it to it starting, which is mostly spent waiting
+    for a connection from the pool.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = {}
+
+    def record(self, name, pool_wait, latency):
+        with self._lock:
+            stats = self.queries.setdefault(name, {
+                'count': 0, 'pool_wait': 0.0, 'max_pool_wait': 0.0,
+                'latency': 0.0, 'max_latency': 0.0
+            })
+            stats['count'] += 1
+            stats['pool_wait'] += pool_wait
+            stats['max_pool_wait'] = max(stats['max_pool_wait'], pool_wait)
+            stats['latency'] += latency
+            stats['max_latency'] = max(stats['max_latency'], latency)
+
+    def summary(self):
+        """Returns {query: {count, mean/max latency, mean/max pool wait}}.
+
+        Times are in seconds.
+        """
+        with self._lock:
+            return {name: {
+                'count': s['count'],
+                'mean_latency': s['latency'] / s['count'],
+                'max_latency': s['max_latency'],
+                'mean_pool_wait': s['pool_wait'] / s['count'],
+                'max_pool_wait': s['max_pool_wait'],
+            } for name, s in self.queries.items()}
+
+    def reset(self):
+        with self._lock:
+            self.queries = {}
+
+    def log(self, level=logging.DEBUG):
+        for name, s in sorted(self.summary().items()):
+            logger.log(level, "%s: %d transaction(s), latency %.1fms mean "
+                       "%.1fms max, pool wait %.1fms mean %.1fms max.",
+                       name, s['count'], 1000 * s['mean_latency'],
+                       1000 * s['max_latency'], 1000 * s['mean_pool_wait'],
+                       1000 * s['max_pool_wait'])
 
 
 class GraphCon(object):
-    def __init__(self, uri, user, password):
-        self._driver = GraphDatabase.driver(uri, auth=(user, password))
+    """Connection to the neo4j database.
+
+    Reads run in read transactions, which a routing driver (a `bolt+routing`
+    uri) sends to the read replicas of a cluster. Every call opens a session
+    from the driver, unless it runs inside `session()`, which reuses one
+    session for a tight loop of calls. Either way, each transaction takes a
+    connection from the driver's pool. The latency and pool wait of every
+    transaction are recorded in `stats`.
+
+    Args:
+        uri (str): The bolt uri of the server.
+        user (str): User name.
+        password (str): Password.
+        check_schema (bool): Whether to check the indexes and constraints
+            the queries rely on when connecting (see database.schema).
+        pool_size (int): Maximum number of connections in the pool, the
+            driver's default if None.
+        fetch_size (int): Default number of documents fetched per page by
+            `get_documents`.
+        **config: Other driver settings, e.g. `connection_timeout`,
+            `connection_acquisition_timeout`, `max_connection_lifetime` or
+            `max_retry_time` (in seconds).
+    """
+    def __init__(self, uri, user, password, check_schema=True,
+                 pool_size=None, fetch_size=1000, **config):
+        if pool_size is not None:
+            config['max_connection_pool_size'] = pool_size
+        self._driver = GraphDatabase.driver(uri, auth=(user, password),
+                                            **config)
+        self.fetch_size = fetch_size
+        self.stats = QueryStats()
+        self._local = threading.local()
+        self.schema = SchemaManager(self._driver)
+        if check_schema:
+            try:
+                self.schema.check()
+            except ClientError as e:
+                logger.warning("Could not check the schema: %s", e)
 
     def close(self):
+        self.stats.log()
         self._driver.close()
 
-    def query(self, query):
+    @contextmanager
+    def session(self):
+        """Reuses one session for the calls made in the block.
+
+        This saves creating a session per call and chains the calls'
+        bookmarks, so each one sees the writes of the ones before it. It
+        doesn't hold a connection: the 1.7 driver still takes one from the
+        pool for every transaction and returns it when the transaction ends.
+        It applies to the calls made on this thread; calls that run their
+        own threads (`get_documents` and the bulk loads) still open their own
+        sessions.
+
+        Examples:
+            with gc.session():
+                for title in titles:
+                    gc.link_documents(title, other)
+        """
+        if getattr(self._local, 'session', None) is not None:
+            yield self._local.session
+            return
         with self._driver.session() as session:
-            result = session.write_transaction(self._query, query)
+            self._local.session = session
+            try:
+                yield session
+            finally:
+                self._local.session = None
+
+    @contextmanager
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is not None:
+            yield session
+        else:
+            with self._driver.session() as session:
+                yield session
+
+    def _transaction(self, session, access_mode, unit_of_work, *args):
+        """Runs `unit_of_work` in a transaction and records its metrics."""
+        started = []
+
+        def timed(tx, *args):
+            started.append(time.perf_counter())
+            return unit_of_work(tx, *args)
+
+        run = session.read_transaction if access_mode == READ_ACCESS \
+            else session.write_transaction
+        start = time.perf_counter()
+        try:
+            return run(timed, *args)
+        finally:
+            end = time.perf_counter()
+            self.stats.record(unit_of_work.__name__.lstrip('_'),
+                              (started[0] if started else end) - start,
+                              end - (started[-1] if started else end))
+
+    def query(self, query, read=False):
+        """Runs a query and returns its records.
+
+        Args:
+            query (str): The Cypher query.
+            read (bool): Whether the query only reads, so it can run in a
+                read transaction.
+        """
+        with self._session() as session:
+            result = self._transaction(
+                session, READ_ACCESS if read else WRITE_ACCESS, self._query,
+                query
+            )
             return result
 
     @staticmethod
@@ -34,9 +194,9 @@ class GraphCon(object):
         return result.records()
 
     def add_document(self, did, title):
-        with self._driver.session() as session:
-            doc = session.write_transaction(self._create_and_return_doc,
-                                            did, title)
+        with self._session() as session:
+            doc = self._transaction(session, WRITE_ACCESS,
+                                    self._create_and_return_doc, did, title)
             logger.log(16, 'neo4j: %s' % doc)
 
     @staticmethod
@@ -50,42 +210,98 @@ class GraphCon(object):
         )
         return result.single()[0]
 
-    def get_documents(self, limit, batch_size=1):
-        for ids in grouper(range(limit), batch_size):
+    def get_documents(self, limit=None, batch_size=None, after=-1,
+                      prefetch=1):
+        """Yields documents (with their paragraphs) in doc_id order.
+
+        Documents are fetched in pages of `batch_size` by keyset pagination
+        (`doc_id > $last`), so gaps in the doc_ids are simply skipped over.
+        The pages are fetched over one session on a background thread, which
+        fetches up to `prefetch` pages ahead while the caller works on the
+        current one.
+
+        Args:
+            limit (int): Maximum number of documents, all of them if None.
+            batch_size (int): Number of documents per page, `fetch_size`
+                if None.
+            after (int): Only documents with a doc_id above this are read.
+            prefetch (int): Number of pages fetched ahead.
+        """
+        batch_size = batch_size or self.fetch_size
+        pages = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        fetcher = threading.Thread(
+            target=self._fetch_pages,
+            args=(pages, stop, limit, batch_size, after),
+            daemon=True
+        )
+        fetcher.start()
+        try:
+            for page in iter(pages.get, None):
+                if isinstance(page, Exception):
+                    raise page
+                for doc in page:
+                    yield doc
+        finally:
+            stop.set()
+            fetcher.join()
+
+    def _fetch_pages(self, pages, stop, limit, batch_size, after):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    return pages.put(item, timeout=0.1)
+                except queue.Full:
+                    continue
+
+        fetched = 0
+        try:
             with self._driver.session() as session:
-                docs = session.write_transaction(self._return_doc, list(ids))
-            for doc in docs:
-                yield Document(
-                    paragraphs=doc.get('paragraphs'),
-                    title=doc.get('d').get('title'),
-                    node_id=doc.get('d').id,
-                    bowv=doc.get('d').get('bowv')
-                )
+                while not stop.is_set() and (limit is None or fetched < limit):
+                    size = batch_size if limit is None else \
+                        min(batch_size, limit - fetched)
+                    records = self._transaction(session, READ_ACCESS,
+                                                self._return_page, after,
+                                                size)
+                    if not records:
+                        break
+                    after = records[-1].get('d').get('doc_id')
+                    fetched += len(records)
+                    put([self._document(r) for r in records])
+        except Exception as e:
+            put(e)
+        put(None)
 
     @staticmethod
-    def _return_doc(tx, ids):
-        logger.log(16, "Fetching %d Document(s) (ids: %d-%d)." %
-                   (len(ids), ids[0], ids[-1]))
+    def _document(record):
+        return Document(
+            paragraphs=record.get('paragraphs'),
+            title=record.get('d').get('title'),
+            node_id=record.get('d').id,
+            bowv=record.get('d').get('bowv')
+        )
+
+    @staticmethod
+    def _return_page(tx, after, size):
+        logger.log(16, "Fetching %d Document(s) after doc_id %d." %
+                   (size, after))
         result = tx.run(
-                "MATCH (d:Document)-[:contains]->(p:Paragraph) "
-                "WHERE d.doc_id in $doc_ids "
-                "RETURN d, COLLECT(p) as paragraphs ",
-                doc_ids=ids
+                "MATCH (d:Document) "
+                "WHERE d.doc_id > $after "
+                "WITH d ORDER BY d.doc_id LIMIT $size "
+                "OPTIONAL MATCH (d)-[:contains]->(p:Paragraph) "
+                "WITH d, p ORDER BY p.pid "
+                "RETURN d, COLLECT(p) as paragraphs ORDER BY d.doc_id ",
+                after=after,
+                size=size
         )
-        return result.records()
+        return list(result.records())
 
     def get_document_from_title(self, title):
-        with self._driver.session() as session:
-            docs = session.write_transaction(
-                self._return_doc_from_title, title
-            )
-            doc = next(docs)
-            return Document(
-                paragraphs=doc.get('paragraphs'),
-                title=doc.get('d').get('title'),
-                id=doc.get('d').id,
-                bowv=doc.get('d').get('bowv')
-            )
+        with self._session() as session:
+            docs = self._transaction(session, READ_ACCESS,
+                                     self._return_doc_from_title, title)
+            return self._document(next(docs))
 
     @staticmethod
     def _return_doc_from_title(tx, title):
@@ -99,9 +315,10 @@ class GraphCon(object):
         return result.records()
 
     def add_paragraph(self, pid, did, text):
-        with self._driver.session() as session:
-            para = session.write_transaction(self._create_and_return_para, pid,
-                                             did, text)
+        with self._session() as session:
+            para = self._transaction(session, WRITE_ACCESS,
+                                     self._create_and_return_para, pid, did,
+                                     text)
             logger.log(15, 'neo4j: %s' % para)
 
     @staticmethod
@@ -118,10 +335,105 @@ class GraphCon(object):
         )
         return result.single()[0]
 
+    def add_documents(self, docs, first_id=0, batch_size=500,
+                      max_workers=4):
+        """Bulk loads documents and their paragraphs.
+
+        Documents are sent in batches, each created along with its
+        paragraphs by a single UNWIND query in one write transaction. At most
+        `max_workers` transactions run at once and no more batches are read
+        ahead, so `docs` is streamed.
+
+        Args:
+            docs: Iterable of Documents. Their doc_ids are their positions in
+                `docs` plus `first_id`, and their paragraphs' pids their
+                positions in the document (as in `add_document` and
+                `add_paragraph`).
+            first_id (int): doc_id of the first document.
+            batch_size (int): Number of documents per transaction.
+            max_workers (int): Maximum number of concurrent transactions.
+
+        Returns:
+            int: The number of nodes created.
+        """
+        rows = (
+            {'did': did, 'title': doc.title,
+             'paragraphs': [{'pid': pid, 'text': p.text}
+                            for pid, p in enumerate(doc.paragraphs())]}
+            for did, doc in enumerate(docs, first_id)
+        )
+        return self._bulk_load(self._create_documents, rows, batch_size,
+                               max_workers)
+
+    def add_paragraphs(self, paragraphs, batch_size=5000, max_workers=4):
+        """Bulk loads paragraphs into existing documents.
+
+        Args:
+            paragraphs: Iterable of (doc_id, pid, Paragraph) tuples.
+            batch_size (int): Number of paragraphs per transaction.
+            max_workers (int): Maximum number of concurrent transactions.
+
+        Returns:
+            int: The number of nodes created.
+        """
+        rows = ({'did': did, 'pid': pid, 'text': p.text}
+                for did, pid, p in paragraphs)
+        return self._bulk_load(self._create_paragraphs, rows, batch_size,
+                               max_workers)
+
+    def _bulk_load(self, unit_of_work, rows, batch_size, max_workers):
+        def load(batch):
+            with self._driver.session() as session:
+                return self._transaction(session, WRITE_ACCESS, unit_of_work,
+                                         batch)
+
+        created = 0
+        pending = set()
+        with ThreadPoolExecutor(max_workers) as executor:
+            for batch in batches(rows, batch_size):
+                if len(pending) >= max_workers:
+                    done, pending = wait(pending,
+                                         return_when=FIRST_COMPLETED)
+                    created += sum(f.result() for f in done)
+                pending.add(executor.submit(load, batch))
+            created += sum(f.result() for f in pending)
+        logger.info("Created %d nodes.", created)
+        return created
+
+    @staticmethod
+    def _create_documents(tx, batch):
+        result = tx.run(
+                "UNWIND $batch AS doc "
+                "CREATE (d:Document) "
+                "SET d.doc_id = doc.did, d.title = doc.title "
+                "FOREACH (para IN doc.paragraphs | "
+                "CREATE (d)-[:contains]->"
+                "(:Paragraph {pid: para.pid, text: para.text})) ",
+                batch=batch
+        )
+        created = result.consume().counters.nodes_created
+        logger.log(16, "neo4j: created %d nodes for %d Document(s)." %
+                   (created, len(batch)))
+        return created
+
+    @staticmethod
+    def _create_paragraphs(tx, batch):
+        result = tx.run(
+                "UNWIND $batch AS para "
+                "MATCH (d:Document) "
+                "WHERE d.doc_id = para.did "
+                "CREATE (d)-[:contains]->"
+                "(:Paragraph {pid: para.pid, text: para.text}) ",
+                batch=batch
+        )
+        created = result.consume().counters.nodes_created
+        logger.log(15, "neo4j: created %d Paragraph(s)." % created)
+        return created
+
     def link_documents(self, title_a, title_b):
-        with self._driver.session() as session:
-            link = session.write_transaction(self._link_documents, title_a,
-                                             title_b)
+        with self._session() as session:
+            link = self._transaction(session, WRITE_ACCESS,
+                                     self._link_documents, title_a, title_b)
             logger.log(16, 'neo4j: %s' % link)
 
     @staticmethod
@@ -137,8 +449,9 @@ class GraphCon(object):
         return result.single()[0]
 
     def get_paragraphs_by_doc_id(self, doc_id):
-        with self._driver.session() as session:
-            paras = session.write_transaction(self._get_paragraphs, doc_id)
+        with self._session() as session:
+            paras = self._transaction(session, READ_ACCESS,
+                                      self._get_paragraphs, doc_id)
             logger.log(16, 'neo4j: %s' % paras)
         for p in paras:
             yield Paragraph(
@@ -157,10 +470,9 @@ class GraphCon(object):
         return result.records()
 
     def set_node_bowv(self, node_id, bowv):
-        with self._driver.session() as session:
-            node = session.write_transaction(
-                self._set_node_bowv, node_id, bowv
-            )
+        with self._session() as session:
+            node = self._transaction(session, WRITE_ACCESS,
+                                     self._set_node_bowv, node_id, bowv)
             logger.log(16, 'neo4j: %s' % node)
 
     @staticmethod
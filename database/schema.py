@@ -0,0 +1,139 @@
+"""Indexes and constraints of the neo4j schema.
+
+GraphCon looks nodes up by these properties, which without an index means a
+scan of every node with the label:
+    - Document.doc_id: adding paragraphs, fetching documents (unique)
+    - Document.title: linking documents, fetching a document by title
+    - Paragraph.pid: ordering a document's paragraphs
+
+Lookups by `id(n)` use the node id directly and need no index.
+
+`SchemaManager.create` idempotently creates whatever is missing (see
+example_db_schema.py) and GraphCon checks the schema when it connects,
+warning about the queries that would fall back to a scan.
+
+"""
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+SchemaIndex = namedtuple('SchemaIndex', ['label', 'property', 'unique'])
+
+SCHEMA = [
+    SchemaIndex('Document', 'doc_id', unique=True),
+    SchemaIndex('Document', 'title', unique=False),
+    SchemaIndex('Paragraph', 'pid', unique=False),
+]
+
+# The GraphCon queries that look nodes up by each (label, property).
+HOT_QUERIES = {
+    ('Document', 'doc_id'): ['add_paragraph', 'add_paragraphs',
+                             'get_documents', 'get_paragraphs_by_doc_id'],
+    ('Document', 'title'): ['link_documents', 'get_document_from_title'],
+    ('Paragraph', 'pid'): ['get_paragraphs_by_doc_id'],
+}
+
+
+class SchemaManager(object):
+    """Declares and creates the indexes and constraints of the schema.
+
+    Args:
+        driver: The neo4j driver to use.
+        schema (list[SchemaIndex]): The indexes (unique ones are created as
+            uniqueness constraints).
+    """
+    def __init__(self, driver, schema=SCHEMA):
+        self._driver = driver
+        self.schema = schema
+
+    def existing(self, online=True):
+        """Returns the indexes as {(label, property): unique}.
+
+        Args:
+            online (bool): Whether to only return the indexes that are online
+                (rather than still populating or failed).
+        """
+        with self._driver.session() as session:
+            records = session.read_transaction(self._indexes)
+        indexes = {}
+        for record in records:
+            if (online and record['state'] != 'ONLINE') or \
+                    len(record['properties']) != 1:
+                continue
+            for label in record['tokenNames']:
+                key = (label, record['properties'][0])
+                indexes[key] = indexes.get(key, False) or \
+                    'unique' in record['type']
+        return indexes
+
+    @staticmethod
+    def _indexes(tx):
+        return list(tx.run("CALL db.indexes() "
+                           "YIELD tokenNames, properties, state, type "
+                           "RETURN tokenNames, properties, state, type"))
+
+    def missing(self):
+        """Returns the SchemaIndexes that don't exist (or aren't online)."""
+        existing = self.existing()
+        return [index for index in self.schema
+                if (index.label, index.property) not in existing or
+                (index.unique and not existing[index.label, index.property])]
+
+    def check(self):
+        """Warns about the queries that will scan for lack of an index.
+
+        Returns:
+            list[SchemaIndex]: The missing indexes.
+        """
+        missing = self.missing()
+        for index in missing:
+            logger.warning(
+                "No %s on :%s(%s), %s will scan every %s node. Create it "
+                "with SchemaManager.create().",
+                'uniqueness constraint' if index.unique else 'index',
+                index.label, index.property,
+                ', '.join(HOT_QUERIES.get((index.label, index.property),
+                                          ['queries'])),
+                index.label
+            )
+        if not missing:
+            logger.debug("All %d schema indexes are online.",
+                         len(self.schema))
+        return missing
+
+    def create(self, timeout=300):
+        """Creates the missing indexes and constraints and waits for them.
+
+        A plain index where a uniqueness constraint is wanted is dropped
+        first, as neo4j can't create a constraint over an indexed property.
+
+        Args:
+            timeout (int): Seconds to wait for the indexes to come online.
+
+        Returns:
+            list[SchemaIndex]: The indexes created.
+        """
+        missing = self.missing()
+        existing = self.existing(online=False) if missing else {}
+        with self._driver.session() as session:
+            for index in missing:
+                if index.unique and \
+                        existing.get((index.label, index.property)) is False:
+                    statement = "DROP INDEX ON :%s(%s)" % (
+                        index.label, index.property)
+                    logger.info("Running: %s", statement)
+                    session.run(statement).consume()
+                logger.info("Running: %s", self._statement(index))
+                session.run(self._statement(index)).consume()
+            if missing:
+                session.run("CALL db.awaitIndexes($timeout)",
+                            timeout=timeout).consume()
+        return missing
+
+    @staticmethod
+    def _statement(index):
+        if index.unique:
+            return "CREATE CONSTRAINT ON (n:%s) ASSERT n.%s IS UNIQUE" % (
+                index.label, index.property)
+        return "CREATE INDEX ON :%s(%s)" % (index.label, index.property)
@@ -0,0 +1,168 @@
+"""Benchmark loading documents into neo4j one node at a time and in bulk.
+
+GraphCon runs against an in-process fake driver that keeps the nodes created
+in memory and simulates a server: every statement and every commit costs a
+round trip of LATENCY seconds, and the `MATCH (d:Document) WHERE d.doc_id =
+$did` lookup scans the documents (no index). A fixture set of documents is
+loaded with the per-node `add_document`/`add_paragraph` calls of
+example_db_upload.py and with `add_documents`, the nodes created are checked
+to be identical and documents/second reported.
+
+"""
+import sys
+import time
+import random
+import logging
+import threading
+from utils import setup_logging
+from data.structures import Document
+from database import db
+from database.db import GraphCon
+
+setup_logging()
+logger = logging.getLogger('benchmark')
+
+NUM_DOCS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+LATENCY = 0.001
+SCAN_COST = 2e-7
+
+
+class Counters(object):
+    def __init__(self, nodes_created):
+        self.nodes_created = nodes_created
+
+
+class Summary(object):
+    def __init__(self, nodes_created):
+        self.counters = Counters(nodes_created)
+
+
+class Result(object):
+    def __init__(self, nodes_created):
+        self.nodes_created = nodes_created
+
+    def single(self):
+        return ['%d nodes created' % self.nodes_created]
+
+    def consume(self):
+        return Summary(self.nodes_created)
+
+
+class FakeTransaction(object):
+    def __init__(self, store):
+        self.store = store
+
+    def run(self, query, **params):
+        time.sleep(LATENCY)
+        if query.startswith('UNWIND $batch AS doc'):
+            created = 0
+            for doc in params['batch']:
+                self.store.add_document(doc['did'], doc['title'])
+                for para in doc['paragraphs']:
+                    self.store.add_paragraph(doc['did'], para['pid'],
+                                             para['text'])
+                created += 1 + len(doc['paragraphs'])
+            return Result(created)
+        if query.startswith('UNWIND $batch AS para'):
+            for para in params['batch']:
+                self.store.scan()
+                self.store.add_paragraph(para['did'], para['pid'],
+                                         para['text'])
+            return Result(len(params['batch']))
+        if query.startswith('CREATE (d:Document)'):
+            self.store.add_document(params['did'], params['title'])
+            return Result(1)
+        if query.startswith('MATCH (d:Document)'):
+            self.store.scan()
+            self.store.add_paragraph(params['did'], params['pid'],
+                                     params['text'])
+            return Result(1)
+        raise ValueError('Unexpected query: %s' % query)
+
+
+class FakeSession(object):
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def write_transaction(self, unit_of_work, *args):
+        result = unit_of_work(FakeTransaction(self.store), *args)
+        time.sleep(LATENCY)
+        return result
+
+
+class FakeDriver(object):
+    def __init__(self):
+        self.documents = {}
+        self.paragraphs = {}
+        self.lock = threading.Lock()
+
+    def session(self):
+        return FakeSession(self)
+
+    def close(self):
+        pass
+
+    def scan(self):
+        time.sleep(SCAN_COST * len(self.documents))
+
+    def add_document(self, did, title):
+        with self.lock:
+            self.documents[did] = title
+
+    def add_paragraph(self, did, pid, text):
+        with self.lock:
+            self.paragraphs[did, pid] = text
+
+
+class FakeGraphDatabase(object):
+    @staticmethod
+    def driver(uri, auth=None, **config):
+        return FakeDriver()
+
+
+def fixture(num_docs, seed=0):
+    rnd = random.Random(seed)
+    words = ['w%d' % n for n in range(1000)]
+    docs = []
+    for n in range(num_docs):
+        text = '\n\n'.join(
+            ' '.join(rnd.choice(words) for _ in range(rnd.randrange(5, 60)))
+            + '.' for _ in range(rnd.randrange(1, 10))
+        )
+        docs.append(Document(
+            '<doc id="%d" url="?curid=%d" title="Doc %d">\nDoc %d\n\n%s\n\n'
+            '</doc>\n' % (n, n, n, n, text)
+        ))
+    return docs
+
+
+def legacy_upload(gc, docs):
+    """The per-node upload loop of example_db_upload.py."""
+    for dn, doc in enumerate(docs):
+        gc.add_document(dn, doc.title)
+        for pn, para in enumerate(doc.paragraphs()):
+            gc.add_paragraph(pn, dn, para.text)
+
+
+db.GraphDatabase = FakeGraphDatabase
+docs = fixture(NUM_DOCS)
+stores = {}
+for name, upload in [('per node', legacy_upload),
+                     ('bulk', lambda gc, docs: gc.add_documents(docs))]:
+    gc = GraphCon('bolt://localhost:7687', 'neo4j', None, check_schema=False)
+    start = time.perf_counter()
+    upload(gc, docs)
+    elapsed = time.perf_counter() - start
+    stores[name] = gc._driver
+    logger.info('%s: %d documents in %.2fs (%.0f documents/s)', name,
+                len(docs), elapsed, len(docs) / elapsed)
+    gc.close()
+
+assert stores['per node'].documents == stores['bulk'].documents
+assert stores['per node'].paragraphs == stores['bulk'].paragraphs
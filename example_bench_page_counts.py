@@ -0,0 +1,29 @@
+"""Benchmark serial vs process pool pageview aggregation.
+
+The hourly files are downloaded to TMP_DIR by the first (warm-up) call, so the
+timed runs measure the gunzip and parse work only.
+
+"""
+import time
+import logging
+from multiprocessing import cpu_count
+from utils import setup_logging
+from data.download import wiki_page_counts
+
+setup_logging()
+logger = logging.getLogger('benchmark')
+logging.getLogger('data.download').setLevel(logging.INFO)
+
+for hours in [12, 48]:
+    wiki_page_counts(min_count=50, num_hours=hours, processes=None)
+    timings = {}
+    for name, processes in [('serial', 1), ('pool', cpu_count())]:
+        start = time.perf_counter()
+        counts = wiki_page_counts(
+            min_count=50, num_hours=hours, processes=processes
+        )
+        timings[name] = time.perf_counter() - start
+        logger.info('%d hours, %d process(es): %.1fs (%d pages)',
+                    hours, processes, timings[name], len(counts))
+    logger.info('%d hours: %.2fx speedup with %d processes.',
+                hours, timings['serial'] / timings['pool'], cpu_count())
@@ -0,0 +1,87 @@
+"""Benchmark the xml dump page parser against the old line state machine.
+
+A synthetic dump with a mix of short and long articles (plus talk pages that
+should be skipped) is parsed by both parsers and pages/second reported.
+
+"""
+import io
+import re
+import time
+import logging
+from utils import setup_logging
+from data.download import pages
+
+setup_logging()
+logger = logging.getLogger('benchmark')
+
+
+def legacy_pages(f):
+    """The line state machine `data.download.pages` used to be."""
+    page = {'text': ''}
+    pos = 'o'
+    for line in f:
+        if pos == 'o':
+            if b'<page>' in line:
+                pos = 'i'
+            else:
+                continue
+
+        elif 'i' in pos:
+            if 'ii' in pos:
+                page['text'] += line.decode('utf-8')
+                if b'</text>' in line:
+                    pos = 'i'
+
+            else:
+                if b'<title>' in line:
+                    page['title'] = re.search(
+                        '<title>(.*)</title>', line.decode('utf-8')
+                    )[1]
+
+                if b'<ns>' in line:
+                    page['ns'] = re.search(
+                        '<ns>(.*)</ns>', line.decode('utf-8')
+                    )[1]
+                    if page['ns'] != '0':
+                        pos = 'o'
+                        page = {'text': ''}
+                        continue
+
+                if b'<id>' in line:
+                    page['id'] = re.search(
+                        '<id>(.*)</id>', line.decode('utf-8')
+                    )[1]
+                elif b'</page>' in line:
+                    pos = 'o'
+                    yield page
+                    page = {'text': ''}
+                elif b'<text' in line:
+                    page['text'] += line.decode('utf-8')
+                    pos = 'ii'
+
+
+def synthetic_dump(num_pages=5000):
+    lines = ['<mediawiki>\n']
+    for n in range(num_pages):
+        body = ('Line %d of an article about [[Thing|things]] and cafés.'
+                '\n' % n) * (2000 if n % 100 == 0 else 40)
+        lines.append(
+            '  <page>\n    <title>Page %d</title>\n    <ns>%d</ns>\n'
+            '    <id>%d</id>\n    <revision>\n      <id>%d</id>\n'
+            '      <text bytes="%d" xml:space="preserve">%s</text>\n'
+            '    </revision>\n  </page>\n'
+            % (n, 0 if n % 5 else 1, n, n + 10**6, len(body), body)
+        )
+    lines.append('</mediawiki>\n')
+    return ''.join(lines).encode('utf-8')
+
+
+dump = synthetic_dump()
+results = {}
+for name, parser in [('legacy', legacy_pages), ('pages', pages)]:
+    start = time.perf_counter()
+    results[name] = list(parser(io.BytesIO(dump)))
+    elapsed = time.perf_counter() - start
+    logger.info('%s: %d pages in %.2fs (%.0f pages/s)', name,
+                len(results[name]), elapsed, len(results[name]) / elapsed)
+assert results['legacy'] == results['pages']
@@ -0,0 +1,120 @@
+"""Benchmark sentence segmenters for speed and boundary accuracy.
+
+Every segmenter in SEGMENTERS splits a small fixture of annotated paragraphs
+(wikipedia style prose with abbreviations, initials, questions, quotes and
+numbers). The sentence boundaries found are compared with the annotated ones
+and precision, recall and F1 reported, then sentences per second are measured
+over the fixture repeated many times. Add a segmenter (see data.segmenter) to
+SEGMENTERS to compare it.
+
+"""
+import time
+import logging
+from utils import setup_logging
+from data.segmenter import RegexSegmenter, RuleSegmenter
+
+setup_logging()
+logger = logging.getLogger('benchmark')
+
+SEGMENTERS = [RegexSegmenter(), RuleSegmenter()]
+
+# Each paragraph is a list of its sentences, which are joined by a space.
+FIXTURE = [
+    ["The thing was first described in 1901 by Dr. Smith of the museum.",
+     "It is found across most of the northern hemisphere."],
+    ["Mr. and Mrs. Jones moved to St. Louis in the spring.",
+     "Their son, J. R. Jones, was born there."],
+    ["Is the population declining?",
+     "Several studies (e.g. those by Brown et al. in 1988) suggest so.",
+     "Others disagree!"],
+    ["The company was founded by Wm. Harris & Co. in New York.",
+     "It moved to the U.S. Virgin Islands in 1950."],
+    ["He said \"it will never work.\"",
+     "It did."],
+    ["The river is 3.5 km long.",
+     "Its source lies at an altitude of approx. 1,200 m above sea level."],
+    ["In 1066, William the Conqueror invaded England.",
+     "The battle of Hastings (Oct. 14, 1066) was decisive."],
+    ["The species was moved to a new genus [citation needed].",
+     "It was later moved back."],
+    ["See also chapter 3, pp. 14-17, and fig. 2 for details.",
+     "The results are summarised in Table 4."],
+    ["The word is used in many languages, i.e. French and Spanish.",
+     "It has no plural form."],
+    ["Why did it happen?",
+     "Nobody knows.",
+     "Perhaps it never will be known..."],
+    ["The band released their first album in 1994 (titled \"Start\").",
+     "A second followed in 1996."],
+    ["Gen. Lee surrendered to Lt. Gen. Grant in Apr. 1865.",
+     "The war ended soon after."],
+    ["The city has a population of 45,000.",
+     "About 12% of residents were born abroad."],
+    ["Prof. A. B. Carter wrote the standard text on the subject.",
+     "It is still in print."],
+    ["The film grossed $3.2 million worldwide.",
+     "Critics were divided."],
+    ["It was built c. 1200 and rebuilt in 1450.",
+     "Only the tower survives."],
+    ["The album includes covers of songs by The Beatles, The Who, etc.",
+     "It was recorded in London."],
+    ["The temple is dedicated to Vishnu.",
+     "Pilgrims visit it every year.",
+     "The main festival is in Jan. and Feb. each year."],
+    ["Smith v. Jones was decided in 1972.",
+     "The court ruled 5-4."],
+    ["The Earth orbits the Sun.",
+     "The Moon orbits the Earth."],
+    ["He said no.",
+     "Then he left."],
+    ["They sat.",
+     "Then they ate."],
+    ["He met Ed.",
+     "They talked for an hour."],
+    ["He fought in World War I.",
+     "His brother served in the navy."],
+    ["The site moved to www.example.com.",
+     "It is free to use."],
+    ["The paper was well received.",
+     "Dr. Smith presented it in Paris."],
+    ["The book sold well.",
+     "J. R. Jones wrote a sequel.",
+     "St. Louis hosted the launch."],
+]
+
+
+def boundaries(paragraph, sentences):
+    """Returns the offsets at which `sentences` after the first start."""
+    starts, pos = [], 0
+    for sentence in sentences:
+        pos = paragraph.find(sentence, pos)
+        starts.append(pos)
+        pos += len(sentence)
+    return set(starts[1:])
+
+
+def accuracy(segmenter):
+    found = correct = expected = 0
+    for sentences in FIXTURE:
+        paragraph = ' '.join(sentences)
+        gold = boundaries(paragraph, sentences)
+        predicted = boundaries(paragraph, segmenter.split(paragraph))
+        found += len(predicted)
+        correct += len(gold & predicted)
+        expected += len(gold)
+    precision = correct / found if found else 1.
+    recall = correct / expected
+    return precision, recall, 2 * precision * recall / (precision + recall)
+
+
+def speed(segmenter, repeats=2000):
+    paragraphs = [' '.join(sentences) for sentences in FIXTURE] * repeats
+    start = time.perf_counter()
+    num_sentences = sum(map(len, segmenter.split_batch(paragraphs)))
+    return num_sentences / (time.perf_counter() - start)
+
+
+for segmenter in SEGMENTERS:
+    precision, recall, f1 = accuracy(segmenter)
+    logger.info('%s: precision %.2f, recall %.2f, F1 %.2f, %.0f sentences/s',
+                segmenter.name, precision, recall, f1, speed(segmenter))
@@ -0,0 +1,135 @@
+"""Benchmark the memory used by Documents held in memory.
+
+A fixture set of synthetic documents is held in memory, as TF-IDF or document
+linking would, both with the original `__dict__` based structures (keeping
+the lines of texts.txt documents and the neo4j records of database documents)
+and with the slotted structures of data.structures. The memory allocated is
+measured with tracemalloc, with and without every document's paragraphs also
+being held.
+
+"""
+import sys
+import random
+import logging
+import tracemalloc
+from utils import setup_logging
+from data.structures import Document
+from data.tokenizer import paragraph_texts
+
+setup_logging()
+logger = logging.getLogger('benchmark')
+
+NUM_DOCS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+class LegacyDocument(object):
+    """`Document` as it was before it was slotted."""
+    class_name = "Document"
+
+    def __init__(self, text=None, paragraphs=None, node_id=None, title=None,
+                 **kwargs):
+        self.class_name = self.class_name
+        self.id = node_id
+        if node_id is None:
+            lines = text.split('\n')
+            self.title = lines[0]
+            self._text = lines[3:-1]
+        else:
+            self.paras = paragraphs
+            self.title = title
+            self._text = None
+            self.bowv = kwargs.get("bowv")
+
+    def paragraphs(self):
+        if self.id is None:
+            for text in paragraph_texts(self._text):
+                yield LegacyParagraph(text)
+        else:
+            for p in self.paras:
+                yield LegacyParagraph(text=p.get('text'), id=p.id)
+
+
+class LegacyParagraph(object):
+    class_name = "Paragraph"
+
+    def __init__(self, text, id=None):
+        self.class_name = self.class_name
+        self._text = text
+        self.id = id
+
+
+class Node(object):
+    """Stand-in for a neo4j Node: an id, labels and a properties dict."""
+    def __init__(self, id, labels, properties):
+        self.id = id
+        self.labels = frozenset(labels)
+        self._properties = properties
+
+    def get(self, key, default=None):
+        return self._properties.get(key, default)
+
+
+def fixture(num_docs, seed=0):
+    rnd = random.Random(seed)
+    words = ['w%d' % n for n in range(5000)]
+    docs = []
+    for n in range(num_docs):
+        paras = ['. '.join(' '.join(rnd.choice(words)
+                                    for _ in range(rnd.randrange(5, 25)))
+                           for _ in range(rnd.randrange(1, 6))) + '.'
+                 for _ in range(rnd.randrange(1, 8))]
+        docs.append((n, 'Doc %d' % n, paras))
+    return docs
+
+
+def file_text(n, title, paras):
+    return '<doc id="%d" url="?curid=%d" title="%s">\n%s\n\n%s\n\n</doc>\n' % (
+        n, n, title, title, '\n\n'.join(paras))
+
+
+def measure(name, make, with_paragraphs=False):
+    tracemalloc.start()
+    docs = [make(*d) for d in fixture_docs]
+    held = [docs]
+    if with_paragraphs:
+        held.append([list(d.paragraphs()) for d in docs])
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    logger.info('%s: %.1f MB (%d bytes per document)', name, size / 2**20,
+                size / len(docs))
+    return size
+
+
+fixture_docs = fixture(NUM_DOCS)
+first_node = [NUM_DOCS]
+
+
+def db_records(n, title, paras):
+    paragraphs = []
+    for text in paras:
+        first_node[0] += 1
+        paragraphs.append(Node(first_node[0], ['Paragraph'],
+                               {'text': text, 'pid': first_node[0]}))
+    return paragraphs
+
+
+def file_doc(cls):
+    return lambda n, title, paras: cls(file_text(n, title, paras))
+
+
+def db_doc(cls):
+    return lambda n, title, paras: cls(
+        paragraphs=db_records(n, title, paras), node_id=n, title=title,
+        bowv=None
+    )
+
+
+logger.info('Holding %d documents.', NUM_DOCS)
+for with_paragraphs in (False, True):
+    suffix = ' (+ paragraphs)' if with_paragraphs else ''
+    for source, make in (('texts.txt', file_doc), ('database', db_doc)):
+        old = measure('legacy %s%s' % (source, suffix), make(LegacyDocument),
+                      with_paragraphs)
+        new = measure('slotted %s%s' % (source, suffix), make(Document),
+                      with_paragraphs)
+        logger.info('%s%s: %.1fx less memory', source, suffix, old / new)
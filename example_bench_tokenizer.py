@@ -0,0 +1,174 @@
+"""Benchmark the single pass tokenizer against the old per-structure splitting.
+
+A fixture set of synthetic documents is split into words by the original
+Document/Paragraph/Sentence generators and by the new views over
+`data.tokenizer.TokenizedText`. The words (and lowercased words) of every
+document, paragraph and sentence are checked to be identical, then the time
+taken to count a vocabulary and to extract skip-grams is reported (the best
+of REPEATS runs, as the timings of a single run are noisy).
+
+"""
+import re
+import time
+import random
+import logging
+from collections import Counter
+import numpy as np
+from utils import setup_logging
+from data.structures import Document
+from data.segmenter import RegexSegmenter
+from data.tokenizer import set_segmenter
+from models.feature_extractors import SkipGramExtractor
+
+setup_logging()
+logger = logging.getLogger('benchmark')
+REPEATS = 3
+# The legacy classes split sentences with the original regex.
+set_segmenter(RegexSegmenter())
+
+
+class LegacyDocument(object):
+    """The file based `Document` as it was before the tokenizer."""
+    def __init__(self, text):
+        self._text = text.split('\n')[3:-1]
+
+    def paragraphs(self):
+        txt = ''
+        for line in self._text:
+            if len(line) > 0:
+                txt += (line+' ')
+            elif len(txt) > 0:
+                yield LegacyParagraph(txt)
+                txt = ''
+
+    def words(self, lower=False):
+        for para in self.paragraphs():
+            for w in para.words(lower):
+                yield w
+
+
+class LegacyParagraph(object):
+    def __init__(self, text):
+        self.text = text
+
+    def sentences(self):
+        for s in re.split(r'(?<=[\)\]\w])\. ', self.text):
+            if len(s) > 0:
+                yield LegacySentence(s)
+
+    def words(self, lower=False):
+        for sent in self.sentences():
+            for w in sent.words(lower):
+                yield w
+
+
+class LegacySentence(object):
+    def __init__(self, text):
+        self.text = text
+
+    def words(self, lower=False):
+        if lower:
+            for w in re.split(r'\W+', self.text):
+                yield w.lower()
+        else:
+            for w in re.split(r'\W+', self.text):
+                yield w
+
+
+def legacy_skip_grams(extractor, docs):
+    """The per-sentence loop `SkipGramExtractor.skip_grams` used to be."""
+    x = []
+    y = []
+    win = extractor.win
+    for doc in docs:
+        for para in doc.paragraphs():
+            for s in para.sentences():
+                text = [extractor.word2int.get(w, 0) for w in s.words()]
+                for i in range(len(text) - 2 * win):
+                    th = extractor.probs.get(text[i+win], extractor.probs[1])
+                    if random.random() > th:
+                        continue
+                    x.append(text[i + win])
+                    y.append(text[i:i + win] +
+                             text[i + 1 + win:i + 1 + 2 * win])
+    x = np.array(x, dtype=np.int32)
+    y = np.array(y, dtype=np.int32).reshape(-1, 2 * win)
+    return x, y
+
+
+WORDS = ['the', 'of', 'and', 'in', 'was', 'Thing', 'ÉCOLE', 'naïve',
+         'İstanbul', 'river', 'population', 'described', 'species', 'north',
+         '1901'] + \
+    ['w%d' % n for n in range(2000)]
+
+
+def fixture_texts(num_docs=2000, seed=0):
+    rnd = random.Random(seed)
+    texts = []
+    for n in range(num_docs):
+        paras = []
+        for _ in range(rnd.randrange(1, 12)):
+            sents = [' '.join(rnd.choice(WORDS)
+                              for _ in range(rnd.randrange(3, 30))) +
+                     rnd.choice(['', ' (x)', ' [y]', ', and.'])
+                     for _ in range(rnd.randrange(1, 8))]
+            paras.append('. '.join(sents) + '.')
+        texts.append('<doc id="%d" url="?curid=%d" title="Doc %d">\n'
+                     'Doc %d\n\n%s\n\n</doc>' %
+                     (n, n, n, n, '\n\n'.join(paras)))
+    return texts
+
+
+def timed(name, fn):
+    elapsed = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        elapsed.append(time.perf_counter() - start)
+    logger.info('%s: %.2fs', name, min(elapsed))
+    return result, min(elapsed)
+
+
+texts = fixture_texts()
+legacy_docs = [LegacyDocument(t) for t in texts]
+docs = [Document(t) for t in texts]
+
+for old, new in zip(legacy_docs, docs):
+    for lower in (False, True):
+        assert list(old.words(lower)) == list(new.words(lower))
+        for old_p, new_p in zip(old.paragraphs(), new.paragraphs()):
+            assert old_p.text == new_p.text
+            assert list(old_p.words(lower)) == list(new_p.words(lower))
+            for old_s, new_s in zip(old_p.sentences(), new_p.sentences()):
+                assert old_s.text == new_s.text
+                assert list(old_s.words(lower)) == list(new_s.words(lower))
+logger.info('Words of %d documents are identical.', len(docs))
+
+
+def count(docs):
+    """Counts words the way `data.vocab.count_words` does."""
+    counts = Counter()
+    for doc in docs:
+        counts.update(doc.words())
+    return counts
+
+
+old_counts, old_time = timed('legacy vocab', lambda: count(legacy_docs))
+new_counts, new_time = timed('tokenizer vocab', lambda: count(docs))
+assert old_counts == new_counts
+logger.info('vocab speedup: %.1fx', old_time / new_time)
+
+extractor = SkipGramExtractor(window=2)
+extractor.counts = new_counts.most_common(1000)
+extractor.word2int = {w: n + 1 for n, (w, _) in enumerate(extractor.counts)}
+extractor.probs = {n: 1. for n in extractor.word2int.values()}
+
+(old_x, old_y), old_time = timed(
+    'legacy skip-grams', lambda: legacy_skip_grams(extractor, legacy_docs)
+)
+(new_x, new_y), new_time = timed(
+    'tokenizer skip-grams', lambda: extractor.skip_grams(docs)
+)
+# With every threshold at 1 no window is subsampled away.
+assert np.array_equal(old_x, new_x) and np.array_equal(old_y, new_y)
+logger.info('skip-gram speedup: %.1fx', old_time / new_time)
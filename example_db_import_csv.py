@@ -0,0 +1,9 @@
+"""Export the wiki documents for a first load with neo4j-admin import. """
+from utils import setup_logging, TMP_DIR
+from database.bulk_import import export_import_csv
+
+setup_logging()
+
+# Logs the neo4j-admin import command to run.
+export_import_csv(out_dir=TMP_DIR + 'import/', processes=4)
+# Once imported, create the indexes by running example_db_schema.py.
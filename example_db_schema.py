@@ -5,7 +5,9 @@ from database.db import GraphCon
 
 setup_logging()
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
-gc = GraphCon('bolt://localhost:7687', 'neo4j', NEO4J_PASSWORD)
+gc = GraphCon('bolt://localhost:7687', 'neo4j', NEO4J_PASSWORD,
+              check_schema=False)
+gc.schema.create()
 
 query = """MATCH (n) WHERE EXISTS(n.abstract) DETACH DELETE n"""
 gc.query(query)
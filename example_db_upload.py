@@ -8,9 +8,6 @@ setup_logging()
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 gc = GraphCon('bolt://localhost:7687', 'neo4j', NEO4J_PASSWORD)
 
-for dn, doc in enumerate(get_documents()):
-    gc.add_document(dn, doc.title)
-    for pn, para in enumerate(doc.paragraphs()):
-        gc.add_paragraph(pn, dn, para.text)
+gc.add_documents(get_documents(), batch_size=500, max_workers=4)
 
 gc.close()
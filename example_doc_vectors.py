@@ -5,8 +5,14 @@ from utils import setup_logging
 from models.neural.word2vec import Word2Vec, W2V_DIR
 from models.statistical.tfidf import TfIdfVectorizer, TFIDF_DIR
 from database.db import GraphCon
+from data.tokenizer import TOKEN_CACHE
 
 setup_logging()
+# Tokenize each document once for both passes below. At roughly 150 bytes
+# per word the 50k documents (roughly 50M words) take about 8GB. With less
+# memory, turn the cache off: the passes read the documents in order, so a
+# cache that can't hold them all never hits.
+TOKEN_CACHE.max_bytes = 8 * 1024**3
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 gc = GraphCon('bolt://localhost:7687', 'neo4j', NEO4J_PASSWORD)
 w2v = Word2Vec.load(W2V_DIR + '1')
@@ -2,7 +2,6 @@
 import os
 import numpy as np
 from utils import setup_logging, TMP_DIR
-from data.structures import get_documents
 from models.neural.word2vec import Word2Vec, W2V_DIR
 from models.feature_extractors import SkipGramExtractor
 
@@ -13,8 +12,8 @@ if not os.path.exists(MODEL_DIR):
 
 # Create w2v training data
 sge = SkipGramExtractor(window=2)
-x, y = sge.docs_to_training_data(docs=get_documents(), size=50000,
-                                 tsv_path=MODEL_DIR + 'vocab.tsv')
+x, y = sge.encoded_to_training_data(size=50000,
+                                    tsv_path=MODEL_DIR + 'vocab.tsv')
 np.save(TMP_DIR + 'x.npy', x)
 np.save(TMP_DIR + 'y.npy', y)
 
@@ -4,10 +4,11 @@ This takes a while on the first call. The extacted data is cached so subsequent
 calls are much faster.
 
 """
-from utils import setup_logging, TMP_DIR
+from utils import setup_logging, TMP_DIR, CACHE
 from data.download import wiki_xml_dump
 
 setup_logging()
+CACHE.max_size = 60 * 1024**3
 wiki_xml_dump(
     txt_file_path=TMP_DIR + 'texts.txt',
     min_count=50,
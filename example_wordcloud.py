@@ -1,6 +1,7 @@
 """Create word cloud based on most viewed wiki page title. """
-from utils import setup_logging, wordcloud
+from utils import setup_logging, wordcloud, CACHE
 from data.download import wiki_page_counts
 
 setup_logging()
+CACHE.max_size = 4 * 1024**3
 wordcloud({w.decode('utf-8'): float(f) for w, f in wiki_page_counts(50)[4:]})
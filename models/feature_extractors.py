@@ -16,9 +16,11 @@ Currently implemented:
 import logging
 from typing import Dict
 import numpy as np
-import random
 from abc import ABC, abstractmethod
+from utils import TMP_DIR
 from data.structures import get_vocab
+from data.tokenizer import word_ids
+from data.encoded import encoded_corpus
 
 logger = logging.getLogger(__name__)
 
@@ -81,8 +83,10 @@ class SkipGramExtractor(FeatureExtractor):
         self.probs = None
         super(SkipGramExtractor, self).__init__(self.class_name, self.in_types)
 
-    def create_word2int(self, size, tsv_path=None):
-        self.counts = get_vocab(size=size - 1)
+    def create_word2int(self, size, tsv_path=None, processes=1,
+                        path=TMP_DIR + 'texts.txt'):
+        self.counts = get_vocab(size=size - 1, processes=processes,
+                                path=path)
         self.word2int = {w[0]: n + 1 for n, w in enumerate(self.counts)}
 
         if tsv_path is not None:
@@ -120,28 +124,94 @@ class SkipGramExtractor(FeatureExtractor):
         return x, y
 
     def docs_to_training_data(self, docs, size, tsv_path=None):
-        x = []
-        y = []
         self.create_word2int(size=size, tsv_path=tsv_path)
-
+        return self.skip_grams(docs)
+
+    def corpus_to_training_data(self, corpus, size, tsv_path=None):
+        """Parallel `docs_to_training_data` over a ShardedCorpus.
+
+        The vocabulary is counted and the skip-grams extracted shard by shard
+        in the corpus' process pool.
+        """
+        self.create_word2int(size=size, tsv_path=tsv_path,
+                             processes=corpus.processes, path=corpus.path)
+        x, y = zip(*corpus.map(self._shard_skip_grams))
+        return np.concatenate(x), np.concatenate(y)
+
+    def _shard_skip_grams(self, docs):
+        # Reseed so forked pool workers don't share a random sequence.
+        np.random.seed()
+        return self.skip_grams(docs)
+
+    def _thresholds(self):
+        """Returns the subsampling threshold of every word id as an array."""
+        ths = np.full(len(self.word2int) + 1, self.probs[1])
+        ths[list(self.probs)] = list(self.probs.values())
+        return ths
+
+    def skip_grams(self, docs, max_tokens=1 << 20):
+        """Returns subsampled (word, context) training pairs from `docs`.
+
+        Every document is tokenized once. The word ids of consecutive
+        documents are gathered into chunks of about `max_tokens`, whose
+        windows are built with numpy at once; windows never cross a sentence
+        boundary.
+        """
+        ths = self._thresholds()
+        pairs, ids, lengths = [], [], []
         for doc in docs:
-            for para in doc.paragraphs():
-                for s in para.sentences():
-                    text = [self.word2int.get(w, 0) for w in s.words()]
-
-                    for i in range(len(text) - 4):
-                        th = self.probs.get(text[i+self.win], self.probs[1])
-
-                        if random.random() > th:
-                            continue
-
-                        x.append(text[i + self.win])
-                        y.append(text[i:i + self.win] +
-                                 text[i + 1 + self.win:i + 1 + 2 * self.win])
-        x = np.array(x, dtype=np.int32)
-        y = np.array(y, dtype=np.int32)
-
-        return x, y
+            tokens = doc.tokenize()
+            ids.extend(word_ids(tokens.words(), self.word2int))
+            lengths.extend(tokens.sentence_lengths())
+            if len(ids) >= max_tokens:
+                pairs.append(self._windows(np.array(ids, dtype=np.int32),
+                                           lengths, ths))
+                ids, lengths = [], []
+        if ids:
+            pairs.append(self._windows(np.array(ids, dtype=np.int32),
+                                       lengths, ths))
+        return self._concatenate(pairs)
+
+    def encoded_to_training_data(self, size, tsv_path=None,
+                                 path=TMP_DIR + 'texts.txt',
+                                 max_tokens=1 << 24):
+        """`docs_to_training_data` from the integer-encoded corpus.
+
+        The corpus is encoded with this vocabulary the first time (see
+        data.encoded), after which no text is read at all.
+        """
+        self.create_word2int(size=size, tsv_path=tsv_path, path=path)
+        encoded = encoded_corpus(self.word2int, path)
+        return self.encoded_skip_grams(encoded, max_tokens)
+
+    def encoded_skip_grams(self, encoded, max_tokens=1 << 24):
+        """Returns subsampled training pairs from an EncodedCorpus."""
+        encoded.check_vocab(self.word2int)
+        ths = self._thresholds()
+        return self._concatenate([
+            self._windows(ids, lengths, ths)
+            for ids, lengths in encoded.sentence_chunks(max_tokens)
+        ])
+
+    def _windows(self, ids, sentence_lengths, ths):
+        """Returns the kept windows of the sentences in `ids`."""
+        span = 2 * self.win
+        if len(ids) <= span:
+            return None
+        sents = np.repeat(np.arange(len(sentence_lengths)), sentence_lengths)
+        starts = np.flatnonzero(sents[:-span] == sents[span:])
+        centres = ids[starts + self.win]
+        keep = np.random.random(len(starts)) <= ths[centres]
+        context = np.r_[0:self.win, self.win + 1:span + 1]
+        return centres[keep], ids[starts[keep, None] + context]
+
+    def _concatenate(self, pairs):
+        pairs = [p for p in pairs if p is not None]
+        if not pairs:
+            return (np.zeros(0, dtype=np.int32),
+                    np.zeros((0, 2 * self.win), dtype=np.int32))
+        x, y = zip(*pairs)
+        return np.concatenate(x), np.concatenate(y)
 
     def to_json(self):
         fe = super().to_json()
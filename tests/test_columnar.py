@@ -0,0 +1,56 @@
+"""Round trip tests of `data.columnar`."""
+import os
+import shutil
+import tempfile
+import unittest
+from data.structures import Document
+from data.columnar import export_columnar, read_columnar
+
+
+class Record(dict):
+    """A neo4j node as GraphCon hands it to Document."""
+    def __init__(self, id, **properties):
+        super(Record, self).__init__(properties)
+        self.id = id
+
+
+def documents():
+    return [
+        Document(
+            paragraphs=[Record(10 * n + k, text='Paragraph %d of %d.' % (k, n))
+                        for k in range(n % 3)],
+            node_id=n, title='Doc %d' % n,
+            bowv=None if n == 4 else [1 / 3 + n, 0.1, 1e-300, -2.5]
+        )
+        for n in range(8)
+    ]
+
+
+class ColumnarTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        for name in ['docs.parquet', 'docs.feather']:
+            path = os.path.join(self.dir, name)
+            docs = documents()
+            export_columnar(docs, path, batch_size=3)
+            read = list(read_columnar(path, batch_size=3))
+            self.assertEqual(len(read), len(docs))
+            for doc, other in zip(docs, read):
+                self.assertEqual(doc.title, other.title)
+                self.assertEqual(doc.id, other.id)
+                self.assertEqual(
+                    [(p.id, p.text) for p in doc.paragraphs()],
+                    [(p.id, p.text) for p in other.paragraphs()]
+                )
+                # float64, so the vectors come back exactly.
+                self.assertEqual(doc.bowv, None if other.bowv is None
+                                 else list(other.bowv))
+
+
+if __name__ == '__main__':
+    unittest.main()
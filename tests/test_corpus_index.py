@@ -0,0 +1,32 @@
+"""Tests of `data.structures.CorpusIndex`."""
+import os
+import shutil
+import tempfile
+import unittest
+from data.structures import CorpusIndex
+
+DOC = '<doc id="%d" url="?curid=%d" title="Doc %d">\nDoc %d\n\nText %d.\n\n' \
+    '</doc>\n'
+
+
+class CorpusIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'texts.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_truncated_document_not_indexed(self):
+        with open(self.path, 'w') as f:
+            f.write(''.join(DOC % ((n,) * 5) for n in range(3)))
+            f.write((DOC % ((3,) * 5))[:-8])
+        with CorpusIndex(self.path) as index:
+            self.assertEqual(len(index), 3)
+            self.assertEqual(index.doc_ids, ['0', '1', '2'])
+            self.assertEqual(index.titles, ['Doc 0', 'Doc 1', 'Doc 2'])
+            self.assertEqual(index[2].title, 'Doc 2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Tests of the vocab artifacts of `data.structures.corpus_vocab`."""
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from data.vocab import Vocab
+from data.segmenter import RegexSegmenter
+from data.tokenizer import get_segmenter, set_segmenter
+from data.structures import corpus_vocab
+
+DOC = '<doc id="%d" url="?curid=%d" title="Doc %d">\nDoc %d\n\nText %d.\n\n' \
+    '</doc>\n'
+
+
+class CorpusVocabTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'texts.txt')
+        self.write(3)
+        self.segmenter = get_segmenter()
+
+    def tearDown(self):
+        set_segmenter(self.segmenter)
+        shutil.rmtree(self.dir)
+
+    def write(self, num_docs):
+        with open(self.path, 'w') as f:
+            f.write(''.join(DOC % ((n,) * 5) for n in range(num_docs)))
+
+    def artifacts(self):
+        return glob.glob(self.path + '.vocab-*.bin')
+
+    def build_all(self):
+        """Builds the vocab for two capacities and two segmenters."""
+        corpus_vocab(self.path)
+        corpus_vocab(self.path, capacity=100)
+        set_segmenter(RegexSegmenter())
+        corpus_vocab(self.path)
+        set_segmenter(self.segmenter)
+
+    def test_other_settings_kept(self):
+        self.build_all()
+        self.assertEqual(len(self.artifacts()), 3)
+        with mock.patch.object(Vocab, 'build', wraps=Vocab.build) as build:
+            self.build_all()
+        build.assert_not_called()
+
+    def test_old_corpus_removed(self):
+        self.build_all()
+        old = self.artifacts()
+        self.write(4)
+        vocab = corpus_vocab(self.path)
+        self.assertEqual(dict(vocab.most_common())['Text'], 4)
+        self.assertEqual(len(self.artifacts()), 1)
+        self.assertFalse(set(old) & set(self.artifacts()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Tests of `database.db.GraphCon.get_documents` against a fake driver."""
+import unittest
+from unittest import mock
+from database.db import GraphCon
+
+
+class Node(dict):
+    def __init__(self, node_id, **properties):
+        super(Node, self).__init__(properties)
+        self.id = node_id
+
+
+# doc_id -> paragraph texts; document 4 has no paragraphs.
+DOCS = {1: ['a b. ', 'c d. '], 2: ['e f. '], 4: [], 7: ['g h. ']}
+
+
+class FakeResult(object):
+    def __init__(self, records):
+        self._records = records
+
+    def records(self):
+        return iter(self._records)
+
+
+class FakeTransaction(object):
+    def run(self, query, after, size):
+        doc_ids = sorted(d for d in DOCS if d > after)[:size]
+        return FakeResult([{
+            'd': Node(doc_id, doc_id=doc_id, title='Doc %d' % doc_id),
+            'paragraphs': [Node(100 * doc_id + n, text=text)
+                           for n, text in enumerate(DOCS[doc_id])]
+        } for doc_id in doc_ids])
+
+
+class FakeSession(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def read_transaction(self, unit_of_work, *args):
+        return unit_of_work(FakeTransaction(), *args)
+
+
+class GetDocumentsTest(unittest.TestCase):
+    def setUp(self):
+        with mock.patch('database.db.GraphDatabase') as graph_database:
+            graph_database.driver.return_value.session = FakeSession
+            self.gc = GraphCon('bolt://fake', 'user', 'password',
+                               check_schema=False)
+
+    def test_pages_skip_gaps(self):
+        docs = list(self.gc.get_documents(batch_size=2))
+        self.assertEqual([d.id for d in docs], [1, 2, 4, 7])
+        self.assertEqual([p.text for p in docs[0].paragraphs()],
+                         ['a b. ', 'c d. '])
+
+    def test_document_without_paragraphs(self):
+        doc = list(self.gc.get_documents(batch_size=2))[2]
+        self.assertEqual(doc.title, 'Doc 4')
+        self.assertEqual(list(doc.paragraphs()), [])
+        self.assertEqual(list(doc.words()), [])
+
+    def test_limit_and_after(self):
+        docs = self.gc.get_documents(limit=2, batch_size=5, after=1)
+        self.assertEqual([d.id for d in docs], [2, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
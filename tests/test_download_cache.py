@@ -0,0 +1,88 @@
+"""Tests of `utils.DownloadCache`."""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Pool
+from utils import DownloadCache, TMP_DIR
+
+URL = 'http://example.invalid/dumps/file-%d.bin'
+
+
+class FakeDownloader(object):
+    """Answers HEAD requests with fixed headers."""
+    def __init__(self, headers):
+        self.headers = headers
+
+    def head(self, url):
+        return self.headers
+
+
+def _add(args):
+    cache_dir, n = args
+    cache = DownloadCache(cache_dir)
+    with open(cache.path(URL % n, 'v1'), 'wb') as f:
+        f.write(b'x' * n)
+    cache.add(URL % n, 'v1')
+
+
+class DownloadCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = DownloadCache(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def store(self, url, validator, size):
+        with open(self.cache.path(url, validator), 'wb') as f:
+            f.write(b'x' * size)
+        return self.cache.add(url, validator)
+
+    def test_adopted_file_is_revalidated(self):
+        for size, kept in [(10, True), (5, False)]:
+            url = URL % os.getpid() + str(size)
+            with open(os.path.join(TMP_DIR, os.path.basename(url)),
+                      'wb') as f:
+                f.write(b'x' * 10)
+            downloader = FakeDownloader({'ETag': '"v2"',
+                                         'Content-Length': str(size)})
+            path, validator = self.cache.lookup(url, downloader)
+            self.assertEqual(validator, '"v2"')
+            self.assertEqual(path is not None, kept)
+            self.assertEqual(os.path.exists(self.cache.path(url, '"v2"')),
+                             kept)
+            self.assertFalse(os.path.exists(self.cache.path(url, '')))
+
+    def test_pinned_kept_for_new_version(self):
+        self.store(URL % 1, 'v1', 10)
+        self.cache.pin(URL % 1)
+        self.store(URL % 1, 'v2', 10)
+        self.cache.max_size = 0
+        self.store(URL % 2, 'v1', 10)
+        self.assertTrue(os.path.exists(self.cache.path(URL % 1, 'v2')))
+
+    def test_stale_partial_evicted(self):
+        partial_path = self.cache.path(URL % 1, 'old') + '.partial'
+        with open(partial_path, 'wb') as f:
+            f.write(b'x' * 100)
+        self.assertEqual(self.cache.size(), 100)
+        self.cache.max_size = 50
+        self.store(URL % 2, 'v1', 10)
+        self.assertTrue(os.path.exists(partial_path))
+        stale = time.time() - 2 * self.cache.max_age
+        os.utime(partial_path, (stale, stale))
+        self.store(URL % 3, 'v1', 10)
+        self.assertFalse(os.path.exists(partial_path))
+        self.assertEqual(self.cache.size(), 20)
+
+    def test_concurrent_processes(self):
+        with Pool(4) as pool:
+            pool.map(_add, [(self.dir, n) for n in range(1, 41)])
+        self.assertEqual(self.cache.size(), sum(range(1, 41)))
+        self.assertEqual(len(self.cache._load()), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Tests of `data.download.wiki_page_counts` on generated pageview files."""
+import io
+import gzip
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from data import download
+from data.download import wiki_page_counts
+
+FILES = ['pageviews-%02d.gz' % h for h in range(7)]
+
+
+def page_view_file(url):
+    """Returns an hourly file with 300 en titles, in random order."""
+    rnd = random.Random(url)
+    lines = [b'en Title_%d %d 0\n' % (rnd.randrange(500), rnd.randint(1, 20))
+             for _ in range(300)]
+    lines += [b'de Seite_%d 5 0\n' % n for n in range(50)]
+    rnd.shuffle(lines)
+    return io.BytesIO(gzip.compress(b''.join(lines)))
+
+
+class WikiPageCountsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        patches = [
+            mock.patch.object(download, 'maybe_download', page_view_file),
+            mock.patch.object(download, 'page_view_files',
+                              lambda num_hours: FILES[-num_hours:]),
+            mock.patch.object(download.DOWNLOADER, 'fetch_all'),
+            mock.patch.object(download.PageCounter.__init__, '__defaults__',
+                              (2000000, self.dir)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def counts(self, **kwargs):
+        return wiki_page_counts(num_hours=len(FILES), max_keys=50, **kwargs)
+
+    def test_pool_matches_serial(self):
+        serial = self.counts(min_count=30, processes=1)
+        self.assertTrue(serial)
+        for processes in [2, 3, 10]:
+            counts = self.counts(min_count=30, processes=processes)
+            self.assertEqual(sorted(counts), sorted(serial))
+            self.assertEqual([c for _, c in counts], [c for _, c in serial])
+
+    def test_pool_top_k(self):
+        serial = self.counts(min_count=0, top_k=25, processes=1)
+        self.assertEqual(len(serial), 25)
+        self.assertEqual(self.counts(min_count=0, top_k=25, processes=3),
+                         serial)
+
+    def test_runs_removed(self):
+        self.counts(min_count=0, processes=3)
+        self.assertEqual(download.os.listdir(self.dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
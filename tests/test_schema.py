@@ -0,0 +1,83 @@
+"""Tests of `database.schema.SchemaManager` against a fake driver."""
+import unittest
+from database.schema import SchemaManager
+
+
+class FakeResult(object):
+    def consume(self):
+        pass
+
+
+class FakeSession(object):
+    """Answers db.indexes() with `indexes` and records other statements."""
+    def __init__(self, indexes, statements):
+        self.indexes = indexes
+        self.statements = statements
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def read_transaction(self, unit_of_work):
+        return unit_of_work(self)
+
+    def run(self, statement, **parameters):
+        if statement.startswith('CALL db.indexes()'):
+            return list(self.indexes)
+        self.statements.append(statement)
+        return FakeResult()
+
+
+class FakeDriver(object):
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.statements = []
+
+    def session(self):
+        return FakeSession(self.indexes, self.statements)
+
+
+def index(label, prop, unique=False, state='ONLINE'):
+    return {'tokenNames': [label], 'properties': [prop], 'state': state,
+            'type': 'node_unique_property' if unique
+            else 'node_label_property'}
+
+
+class SchemaManagerTest(unittest.TestCase):
+    def test_create_missing(self):
+        driver = FakeDriver([index('Document', 'title')])
+        created = SchemaManager(driver).create()
+        self.assertEqual([(i.label, i.property) for i in created],
+                         [('Document', 'doc_id'), ('Paragraph', 'pid')])
+        self.assertEqual(driver.statements[:2], [
+            'CREATE CONSTRAINT ON (n:Document) ASSERT n.doc_id IS UNIQUE',
+            'CREATE INDEX ON :Paragraph(pid)',
+        ])
+
+    def test_index_replaced_by_constraint(self):
+        for state in ['ONLINE', 'FAILED']:
+            driver = FakeDriver([index('Document', 'doc_id', state=state),
+                                 index('Document', 'title'),
+                                 index('Paragraph', 'pid')])
+            manager = SchemaManager(driver)
+            self.assertEqual([(i.label, i.property)
+                              for i in manager.missing()],
+                             [('Document', 'doc_id')])
+            manager.create()
+            self.assertEqual(driver.statements[:2], [
+                'DROP INDEX ON :Document(doc_id)',
+                'CREATE CONSTRAINT ON (n:Document) ASSERT n.doc_id IS UNIQUE',
+            ])
+
+    def test_nothing_missing(self):
+        driver = FakeDriver([index('Document', 'doc_id', unique=True),
+                             index('Document', 'title'),
+                             index('Paragraph', 'pid')])
+        self.assertEqual(SchemaManager(driver).create(), [])
+        self.assertEqual(driver.statements, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
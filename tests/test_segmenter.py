@@ -0,0 +1,68 @@
+"""Tests of `data.segmenter.RuleSegmenter`."""
+import unittest
+from data.segmenter import RuleSegmenter
+
+
+class RuleSegmenterTest(unittest.TestCase):
+    def setUp(self):
+        self.segmenter = RuleSegmenter()
+
+    def assertSplits(self, paragraph, sentences):
+        self.assertEqual(self.segmenter.split(paragraph), sentences)
+
+    def test_words_that_are_abbreviations(self):
+        self.assertSplits('The Earth orbits the Sun. The Moon orbits Earth. ',
+                          ['The Earth orbits the Sun',
+                           'The Moon orbits Earth'])
+        self.assertSplits('He said no. Then he left. ',
+                          ['He said no', 'Then he left'])
+        self.assertSplits('They sat. Then they ate. ',
+                          ['They sat', 'Then they ate'])
+        self.assertSplits('He met Ed. They talked. ',
+                          ['He met Ed', 'They talked'])
+
+    def test_roman_numeral(self):
+        self.assertSplits('He fought in World War I. His brother did too. ',
+                          ['He fought in World War I',
+                           'His brother did too'])
+        self.assertSplits('It was built by Henry V. The king paid. ',
+                          ['It was built by Henry V', 'The king paid'])
+
+    def test_domain_name(self):
+        self.assertSplits('Visit www.example.com. It is free. ',
+                          ['Visit www.example.com', 'It is free'])
+
+    def test_abbreviations(self):
+        self.assertSplits('Dr. Smith met Mr. and Mrs. Jones. They ate. ',
+                          ['Dr. Smith met Mr. and Mrs. Jones', 'They ate'])
+        self.assertSplits('It was written by J. R. Jones and I. M. Pei. ',
+                          ['It was written by J. R. Jones and I. M. Pei'])
+        self.assertSplits('Prof. A. B. Carter wrote it. ',
+                          ['Prof. A. B. Carter wrote it'])
+        self.assertSplits('Smith v. Jones was decided in 1972. ',
+                          ['Smith v. Jones was decided in 1972'])
+        self.assertSplits('Some cities, e.g. Paris, are in the U.S. Census. ',
+                          ['Some cities, e.g. Paris, are in the U.S. Census'])
+        self.assertSplits('See No. 5 on p. 12 of Vol. 3. It is short. ',
+                          ['See No. 5 on p. 12 of Vol. 3', 'It is short'])
+        self.assertSplits('He sold apples, pears, etc. Then he left. ',
+                          ['He sold apples, pears, etc', 'Then he left'])
+
+    def test_abbreviation_opens_sentence(self):
+        self.assertSplits('He left. Dr. Smith came. ',
+                          ['He left', 'Dr. Smith came'])
+        self.assertSplits('He sold apples. J. R. Jones bought them. ',
+                          ['He sold apples', 'J. R. Jones bought them'])
+        self.assertSplits('The war ended. Gen. Lee surrendered. ',
+                          ['The war ended', 'Gen. Lee surrendered'])
+        self.assertSplits('It rained. U.S. Route 1 was shut. ',
+                          ['It rained', 'U.S. Route 1 was shut'])
+
+    def test_last_sentence_without_trailing_whitespace(self):
+        self.assertSplits('It rained. Is it over?!',
+                          ['It rained', 'Is it over'])
+        self.assertSplits('It rained', ['It rained'])
+
+
+if __name__ == '__main__':
+    unittest.main()
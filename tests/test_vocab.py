@@ -0,0 +1,60 @@
+"""Tests of the pruned counting of `data.vocab.VocabCounter`."""
+import random
+import unittest
+from collections import Counter
+from data.vocab import VocabCounter
+
+
+def stream(seed):
+    """Returns a shuffled stream of 40 words, a few much more common."""
+    rnd = random.Random(seed)
+    words = []
+    for n in range(40):
+        words += ['w%d' % n] * (200 - 10 * n if n < 5 else rnd.randint(1, 60))
+    rnd.shuffle(words)
+    return words
+
+
+class VocabCounterTest(unittest.TestCase):
+    def assertBounded(self, counter, true):
+        for word, count in true.items():
+            estimate = counter.counts.get(word)
+            if estimate is None:
+                self.assertLessEqual(count, counter.error)
+            else:
+                self.assertLessEqual(count, estimate)
+                self.assertLessEqual(estimate, count + counter.error)
+
+    def test_pruned_counts(self):
+        for seed in range(20):
+            words = stream(seed)
+            true = Counter(words)
+            counter = VocabCounter(capacity=10)
+            for n in range(0, len(words), 7):
+                counter.update(words[n:n + 7])
+            counter.prune()
+            self.assertBounded(counter, true)
+            self.assertEqual([w for w, _ in counter.most_common(5)],
+                             [w for w, _ in true.most_common(5)])
+
+    def test_merged_counts(self):
+        for seed in range(20):
+            words = stream(seed)
+            true = Counter(words)
+            counters = []
+            for shard in range(4):
+                counter = VocabCounter(capacity=10)
+                for n in range(shard * 7, len(words), 28):
+                    counter.update(words[n:n + 7])
+                counters.append(counter)
+            merged = VocabCounter(capacity=10)
+            for counter in counters:
+                merged.merge(counter)
+            merged.prune()
+            self.assertBounded(merged, true)
+            self.assertEqual([w for w, _ in merged.most_common(5)],
+                             [w for w, _ in true.most_common(5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,27 @@
 import os
+import re
 import sys
-from urllib.request import urlopen
+import json
+import time
+import base64
+import hashlib
+import threading
+import http.client
+from contextlib import contextmanager
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit, unquote
+from urllib.request import getproxies, proxy_bypass
 from wordcloud import WordCloud
 import webbrowser
 import coloredlogs
 import logging
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +29,9 @@ TMP_DIR = os.getcwd() + '/tmp/'
 if not os.path.exists(TMP_DIR):
     os.makedirs(TMP_DIR)
 
+USER_AGENT = 'simonhkswan-nlp (https://github.com/simonhkswan/nlp) ' \
+    'Python/%d.%d' % sys.version_info[:2]
+
 
 def setup_logging():
     def trace(self, msg, *args, **kwargs):
@@ -52,26 +72,577 @@ def setup_logging():
     )
 
 
-def maybe_download(url):
-    local_path = os.path.join(TMP_DIR, os.path.split(url)[1])
-    if os.path.exists(local_path):
+class Downloader(object):
+    """Fetches urls over reused keep-alive connections.
+
+    Every thread keeps one persistent HTTP(S) connection per host, so the
+    directory listings and files fetched from a server share connections
+    rather than opening a new one per request. `fetch_all` downloads several
+    files at once with at most `max_workers` in flight.
+
+    Every request identifies itself with `user_agent`, as Wikimedia asks of
+    its clients, and goes through the proxy the environment configures
+    (`http_proxy`, `https_proxy` and `no_proxy`, as for urllib).
+
+    Args:
+        max_workers (int): Maximum number of concurrent downloads.
+        timeout (float): Socket timeout in seconds.
+        max_redirects (int): Maximum number of redirects followed per request.
+        user_agent (str): User-Agent header sent with every request.
+        proxies (dict): Proxy url by scheme, read from the environment if
+            None.
+    """
+    def __init__(self, max_workers=4, timeout=60, max_redirects=5,
+                 user_agent=USER_AGENT, proxies=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.user_agent = user_agent
+        self.proxies = getproxies() if proxies is None else proxies
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def _connection(self, scheme, host):
+        if self._pid != os.getpid():
+            # Forked: don't share the parent's sockets.
+            self._local = threading.local()
+            self._pid = os.getpid()
+        connections = self._local.__dict__.setdefault('connections', {})
+        if (scheme, host) not in connections:
+            connections[scheme, host] = self._connect(scheme, host)
+        return connections[scheme, host]
+
+    def _connect(self, scheme, host):
+        """Opens a connection to `host`, through the proxy if there is one.
+
+        https is tunnelled through the proxy with CONNECT, while plain http
+        requests are sent to the proxy with the absolute url.
+
+        Returns:
+            tuple: The connection, and the headers each request on it needs
+                (None if not proxied).
+        """
+        cls = HTTPSConnection if scheme == 'https' else HTTPConnection
+        proxy = self.proxies.get(scheme)
+        if not proxy or proxy_bypass(host):
+            return cls(host, timeout=self.timeout), None
+        proxy = urlsplit(proxy if '//' in proxy else '//' + proxy)
+        proxy_host = proxy.hostname + (
+            ':%d' % proxy.port if proxy.port else '')
+        headers = {}
+        if proxy.username:
+            credentials = '%s:%s' % (unquote(proxy.username),
+                                     unquote(proxy.password or ''))
+            headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(
+                credentials.encode('utf-8')).decode('ascii')
+        if scheme == 'https':
+            connection = cls(proxy_host, timeout=self.timeout)
+            connection.set_tunnel(host, headers=headers)
+            return connection, None
+        return cls(proxy_host, timeout=self.timeout), headers
+
+    def _request(self, method, scheme, host, path, headers):
+        connection, proxy_headers = self._connection(scheme, host)
+        if proxy_headers is not None:
+            path = '%s://%s%s' % (scheme, host, path)
+            headers = dict(headers, **proxy_headers)
+        try:
+            connection.request(method, path, headers=headers)
+            return connection.getresponse()
+        except (ConnectionError, http.client.HTTPException):
+            # The kept-alive connection was dropped, reconnect once.
+            connection.close()
+            connection.request(method, path, headers=headers)
+            return connection.getresponse()
+
+    def get(self, url, headers=None, method='GET'):
+        """Sends a GET (or `method`) request for `url`, following redirects.
+
+        The response must be read to the end (or closed) before the same
+        thread makes another request to the same host.
+
+        Raises:
+            HTTPError: If the server responds with an error status.
+        """
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(url)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            response = self._request(
+                method, parts.scheme, parts.netloc, path,
+                dict({'User-Agent': self.user_agent}, **(headers or {}))
+            )
+            if response.status in (301, 302, 303, 307, 308):
+                response.read()
+                url = urljoin(url, response.headers['Location'])
+                continue
+            if response.status >= 400:
+                response.read()
+                raise HTTPError(url, response.status, response.reason,
+                                response.headers, None)
+            return response
+        raise HTTPError(url, response.status, 'Too many redirects',
+                        response.headers, None)
+
+    def read(self, url):
+        """Returns the body of `url`."""
+        with self.get(url) as response:
+            return response.read()
+
+    def head(self, url):
+        """Returns the response headers of `url`."""
+        with self.get(url, method='HEAD') as response:
+            response.read()
+            return response.headers
+
+    def fetch_all(self, urls, **kwargs):
+        """Downloads `urls` to TMP_DIR concurrently (see `maybe_download`).
+
+        Returns:
+            list[str]: The local paths, in the order of `urls`.
+        """
+        def fetch(url):
+            with maybe_download(url, downloader=self, **kwargs) as f:
+                return f.name
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            return list(executor.map(fetch, urls))
+
+
+def file_checksum(path, hash_name='md5', chunk_size=1024*1024*8):
+    """Returns the hex digest of the file at `path`."""
+    h = hashlib.new(hash_name)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def published_checksum(sums_url, filename):
+    """Looks up `filename` in a published `<hexdigest>  <filename>` list.
+
+    Wikimedia publishes the checksums of the `latest` dumps under their dated
+    names, so `latest` in `filename` matches any 8 digit date.
+
+    Returns:
+        str: The hex digest, or None if the file is not listed.
+    """
+    name = re.compile(re.escape(filename).replace('latest', r'(latest|\d{8})'))
+    try:
+        sums = DOWNLOADER.read(sums_url).decode('utf-8').splitlines()
+    except IOError as e:
+        logger.warning("Could not fetch checksums from %s: %s", sums_url, e)
+        return None
+    for line in sums:
+        fields = line.split()
+        if len(fields) == 2 and name.fullmatch(fields[1]):
+            return fields[0]
+    logger.warning("No checksum for %s found in %s.", filename, sums_url)
+    return None
+
+
+def download(url, local_path, checksum=None, hash_name='md5', retries=3,
+             chunk_size=1024*1024*4, downloader=None):
+    """Downloads `url` to `local_path`, resuming from a partial download.
+
+    The data is written to `local_path + '.partial'`, and an interrupted
+    download is resumed from the end of that file with an HTTP Range request
+    (retrying up to `retries` times). Once the size matches the
+    content-length, and the checksum if one is given, the file is renamed to
+    `local_path`, so an existing `local_path` is always complete.
+
+    Args:
+        url (str): Url of the file.
+        local_path (str): Path to save the file at.
+        checksum (str): Optional expected hex digest of the file.
+        hash_name (str): hashlib algorithm of `checksum`.
+        retries (int): Number of times to resume after a failed attempt.
+        chunk_size (int): Number of bytes read and written at a time.
+        downloader (Downloader): Downloader whose connections are used,
+            defaults to the shared `DOWNLOADER`.
+
+    Raises:
+        IOError: If the download is still incomplete after every retry, or
+            the checksum does not match.
+    """
+    downloader = downloader or DOWNLOADER
+    partial_path = local_path + '.partial'
+    for attempt in range(retries + 1):
+        offset = 0
+        if os.path.exists(partial_path):
+            offset = os.path.getsize(partial_path)
+            logger.info("Resuming download of %s from %dkb.",
+                        url, offset / 1024)
+        try:
+            total = _download_range(downloader, url, partial_path, offset,
+                                    chunk_size)
+        except (IOError, http.client.HTTPException) as e:
+            if isinstance(e, HTTPError) and e.code < 500:
+                raise
+            logger.warning("Download of %s failed (attempt %d): %s",
+                           url, attempt + 1, e)
+            continue
+        size = os.path.getsize(partial_path)
+        if total is None or size == total:
+            break
+        logger.warning("Download of %s incomplete (%d/%d bytes).",
+                       url, size, total)
+    else:
+        raise IOError("Failed to download %s after %d attempts." %
+                      (url, retries + 1))
+
+    if checksum is not None:
+        digest = file_checksum(partial_path, hash_name)
+        if digest != checksum.lower():
+            os.remove(partial_path)
+            raise IOError("%s checksum mismatch for %s: expected %s, got %s." %
+                          (hash_name, url, checksum, digest))
+        logger.debug("%s checksum verified for %s.", hash_name, local_path)
+    os.replace(partial_path, local_path)
+
+
+def _download_range(downloader, url, path, offset, chunk_size):
+    """Appends the bytes of `url` from `offset` onwards to `path`.
+
+    Returns:
+        int: Total size of the file, or None if the server did not say.
+    """
+    headers = {'Range': 'bytes=%d-' % offset} if offset else {}
+    try:
+        df = downloader.get(url, headers)
+    except HTTPError as e:
+        if e.code == 416:
+            # Requested range not satisfiable: the partial file is complete.
+            return offset
+        raise
+    with df:
+        if offset and df.status != 206:
+            logger.debug("Range not supported by server, restarting.")
+            offset = 0
+        length = df.headers.get('content-length')
+        total = None if length is None else offset + int(length)
+        logger.debug("File size: %skb", (total or 0) / 1024)
+        downloaded, dl = offset, 0
+        with open(path, 'ab' if offset else 'wb') as of:
+            for chunk in iter(lambda: df.read(chunk_size), b''):
+                of.write(chunk)
+                downloaded += len(chunk)
+                dl += len(chunk)
+                if dl > (1024*1000*10):
+                    logger.trace('%d kb downloaded.' % (downloaded/1024))
+                    dl = 0
+    return total
+
+
+class DownloadCache(object):
+    """Size-bounded cache of downloaded files.
+
+    Files are stored in `cache_dir` under a key derived from their url and
+    the ETag (or Last-Modified) header the server gives them, so a changed
+    file is downloaded again rather than shadowed by a stale copy. A JSON
+    manifest records each entry's url, size, and last access. Once the
+    cache grows past `max_size` bytes, the least recently used entries that
+    are not pinned are deleted, after any partial downloads that haven't
+    been written to for `max_age` seconds (left behind when a download was
+    abandoned or the file changed on the server). Every lookup is logged as
+    a hit or miss to `access.log` in `cache_dir`.
+
+    An entry checked against the server within the last `max_age` seconds is
+    used without sending a HEAD request, as is the latest entry for a url if
+    the server cannot be reached. Files downloaded to TMP_DIR before the
+    cache existed are moved into it the first time their url is looked up,
+    and kept as the current version if their size matches the server's.
+
+    The manifest is updated under a file lock, so the cache can be shared
+    by several processes (such as the workers of a Pool).
+
+    Args:
+        cache_dir (str): Directory the files and manifest are kept in.
+        max_size (int): Maximum total size in bytes, None for no limit.
+        max_age (float): Seconds before an entry is revalidated.
+    """
+    def __init__(self, cache_dir=TMP_DIR + 'cache/', max_size=None,
+                 max_age=60*60*24):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age = max_age
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.lock_path = os.path.join(cache_dir, 'manifest.lock')
+        self.log_path = os.path.join(cache_dir, 'access.log')
+        self.hits, self.misses = 0, 0
+        self._lock = threading.RLock()
+        self._lock_file = None
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    @contextmanager
+    def _locked(self):
+        """Holds the manifest lock (re-entrant, across processes too)."""
+        with self._lock:
+            if self._lock_file is not None:
+                yield
+                return
+            with open(self.lock_path, 'a') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                self._lock_file = f
+                try:
+                    yield
+                finally:
+                    self._lock_file = None
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, 'r') as f:
+            entries = json.load(f)
+        return {k: e for k, e in entries.items() if os.path.exists(e['path'])}
+
+    def _save(self, entries):
+        tmp_path = self.manifest_path + '.%d.tmp' % os.getpid()
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _log(self, hit, url):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        logger.debug("Download cache %s: %s", 'hit' if hit else 'miss', url)
+        with open(self.log_path, 'a') as f:
+            f.write('%s\t%s\t%s\n' % (
+                time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'hit' if hit else 'miss', url
+            ))
+
+    def key(self, url, validator):
+        """Returns the manifest key of the version `validator` of `url`."""
+        return hashlib.sha1(
+            ('%s\n%s' % (url, validator)).encode('utf-8')
+        ).hexdigest()[:16]
+
+    def path(self, url, validator):
+        """Returns the path the version `validator` of `url` is stored at."""
+        return os.path.join(
+            self.cache_dir,
+            '%s-%s' % (self.key(url, validator), os.path.basename(url))
+        )
+
+    @staticmethod
+    def validator(url, downloader=None):
+        """Returns the ETag or Last-Modified header of `url` ('' if neither).
+        """
+        return DownloadCache._validator(
+            (downloader or DOWNLOADER).head(url))
+
+    @staticmethod
+    def _validator(headers):
+        return headers.get('ETag') or headers.get('Last-Modified') or ''
+
+    def lookup(self, url, downloader=None):
+        """Looks `url` up in the cache.
+
+        Returns:
+            tuple[str, str]: The path of the cached file (None on a miss) and
+                the current validator of the url.
+        """
+        with self._locked():
+            entries = self._load()
+            latest = max(
+                (e for e in entries.values() if e['url'] == url),
+                key=lambda e: e['checked'], default=None
+            )
+            if latest is None:
+                latest = self._adopt(url)
+        now = time.time()
+        if latest is not None and (
+                now - latest['checked'] < self.max_age or
+                not (latest['validator'] or latest.get('adopted'))):
+            # No validator means the server gives no way to tell if the file
+            # changed, so the cached copy is used as it is.
+            return self._touch(url, latest['validator']), latest['validator']
+        try:
+            headers = (downloader or DOWNLOADER).head(url)
+        except (IOError, http.client.HTTPException) as e:
+            if latest is None:
+                raise
+            logger.warning("Could not revalidate %s (%s), using cached copy.",
+                           url, e)
+            return self._touch(url, latest['validator']), latest['validator']
+        validator = self._validator(headers)
+        if latest is not None and latest.get('adopted'):
+            self._revalidate_adopted(url, validator, headers)
+        return self._touch(url, validator, checked=now), validator
+
+    def _adopt(self, url):
+        """Moves a file downloaded to TMP_DIR before the cache existed in.
+
+        It is stored without a validator until the server is asked for one
+        (see `_revalidate_adopted`).
+        """
+        legacy_path = os.path.join(TMP_DIR, os.path.basename(url))
+        if not os.path.exists(legacy_path):
+            return None
+        logger.info("Moving %s into the download cache.", legacy_path)
+        os.replace(legacy_path, self.path(url, ''))
+        self.add(url, '', adopted=True)
+        return {'validator': '', 'checked': 0, 'adopted': True}
+
+    def _revalidate_adopted(self, url, validator, headers):
+        """Keeps an adopted file if its size matches the server's file.
+
+        It then becomes the entry of the current version, `validator`, and is
+        otherwise removed.
+        """
+        length = headers.get('Content-Length')
+        with self._locked():
+            entries = self._load()
+            entry = entries.pop(self.key(url, ''), None)
+            if entry is None:
+                return
+            if length is not None and int(length) == entry['size']:
+                logger.debug("Adopted %s is the current version.",
+                             entry['path'])
+                path = self.path(url, validator)
+                os.replace(entry['path'], path)
+                entry.update(path=path, validator=validator, adopted=False)
+                entries[self.key(url, validator)] = entry
+            else:
+                logger.info("Adopted %s is out of date, removing it.",
+                            entry['path'])
+                os.remove(entry['path'])
+            self._save(entries)
+
+    def _touch(self, url, validator, checked=None):
+        """Marks an entry as used, returning its path (None if not cached)."""
+        with self._locked():
+            entries = self._load()
+            entry = entries.get(self.key(url, validator))
+            self._log(entry is not None, url)
+            if entry is None:
+                return None
+            entry['accessed'] = time.time()
+            if checked is not None:
+                entry['checked'] = checked
+            self._save(entries)
+            return entry['path']
+
+    def add(self, url, validator, pinned=None, adopted=False):
+        """Records the file downloaded to `path(url, validator)`.
+
+        Least recently used entries are evicted if the cache is now too big.
+
+        Args:
+            pinned (bool): Whether to pin the entry, by default whether the
+                other versions of `url` are pinned.
+        """
+        path = self.path(url, validator)
+        now = time.time()
+        with self._locked():
+            entries = self._load()
+            if pinned is None:
+                pinned = any(e['pinned'] for e in entries.values()
+                             if e['url'] == url)
+            entries[self.key(url, validator)] = {
+                'url': url, 'validator': validator, 'path': path,
+                'size': os.path.getsize(path), 'accessed': now,
+                'checked': 0 if adopted else now, 'pinned': pinned,
+                'adopted': adopted
+            }
+            self._evict(entries, keep=path)
+            self._save(entries)
+        return path
+
+    def pin(self, url, pinned=True):
+        """Pins (or unpins) every cached version of `url` against eviction."""
+        with self._locked():
+            entries = self._load()
+            for entry in entries.values():
+                if entry['url'] == url:
+                    entry['pinned'] = pinned
+            self._save(entries)
+
+    def _partials(self):
+        """Returns the (path, size, mtime) of the partial downloads."""
+        partials = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.partial'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                partials.append((os.path.join(self.cache_dir, name),
+                                 stat.st_size, stat.st_mtime))
+        return partials
+
+    def size(self):
+        """Returns the total size in bytes of the cached files.
+
+        Partial downloads are included.
+        """
+        with self._locked():
+            return sum(e['size'] for e in self._load().values()) + \
+                sum(p[1] for p in self._partials())
+
+    def _evict(self, entries, keep=None):
+        if self.max_size is None:
+            return
+        partials = self._partials()
+        total = sum(e['size'] for e in entries.values()) + \
+            sum(p[1] for p in partials)
+        stale = time.time() - self.max_age
+        for path, size, mtime in sorted(partials, key=itemgetter(2)):
+            if total <= self.max_size or mtime > stale:
+                break
+            logger.info("Removing abandoned partial download %s.", path)
+            os.remove(path)
+            total -= size
+        lru = sorted(entries.items(), key=lambda item: item[1]['accessed'])
+        for key, entry in lru:
+            if total <= self.max_size:
+                break
+            if entry['pinned'] or entry['path'] == keep:
+                continue
+            logger.info("Evicting %s from the download cache.", entry['path'])
+            os.remove(entry['path'])
+            total -= entry['size']
+            del entries[key]
+        if total > self.max_size:
+            logger.warning("Download cache size %dkb is over its %dkb limit.",
+                           total / 1024, self.max_size / 1024)
+
+
+def maybe_download(url, checksum=None, hash_name='md5', sums_url=None,
+                   downloader=None, cache=None):
+    """Returns the cached download of `url`, downloading it if necessary.
+
+    See `download` for the arguments. If `sums_url` is given, and the file
+    is not cached, the checksum is looked up in that published list.
+
+    Args:
+        cache (DownloadCache): Cache to use, defaults to the shared `CACHE`.
+
+    Returns:
+        The local copy of the file opened in 'rb' mode.
+    """
+    cache = cache or CACHE
+    local_path, validator = cache.lookup(url, downloader)
+    if local_path is not None:
         logger.debug("Using cached download at %s", local_path)
-        return open(local_path, 'rb')
     else:
         logger.info("Downloading file from %s.", url)
-        with urlopen(url) as df:
-            file_size = int(df.headers.get('content-length')) / 1024
-            logger.debug("File size: %skb", file_size)
-            downloaded, dl = 0, 0
-            with open(local_path, 'wb') as of:
-                for _ in df:
-                    of.write(_)
-                    downloaded += len(_)
-                    dl += len(_)
-                    if dl > (1024*1000*10):
-                        logger.trace('%d kb downloaded.' % (downloaded/1024))
-                        dl = 0
-        return open(local_path, 'rb')
+        if sums_url is not None and checksum is None:
+            checksum = published_checksum(sums_url, os.path.basename(url))
+        download(url, cache.path(url, validator), checksum=checksum,
+                 hash_name=hash_name, downloader=downloader)
+        local_path = cache.add(url, validator)
+    return open(local_path, 'rb')
+
+
+DOWNLOADER = Downloader()
+CACHE = DownloadCache()
 
 
 def wordcloud(frequencies, path=None):